@@ -1,10 +1,133 @@
 import os
 import sys
+import json
+import random
+import hashlib
 import argparse
+import threading
 from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
 import requests
+from requests.adapters import HTTPAdapter
 
-def process_directory(directory_path: str, file_type: str = "regulation", base_url: str = "http://localhost:8000", namespace: str = "permanent"):
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MANIFEST_NAME = ".ingest_manifest.json"
+# Seconds to wait for one file's ingestion job before recording it as failed
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "1800"))
+# Per-request (connect, read) timeouts in seconds, so a stalled server can't hang a worker forever
+REQUEST_TIMEOUT = (float(os.getenv("REQUEST_CONNECT_TIMEOUT", "10")), float(os.getenv("REQUEST_READ_TIMEOUT", "120")))
+
+
+class Manifest:
+    """Content hashes already ingested, per namespace, so reruns skip finished files.
+
+    Stored as JSON: {namespace: {sha256: {"filename", "doc_id", "clauses", "ingested_at"}}}.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if path.exists():
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def contains(self, namespace: str, content_hash: str) -> bool:
+        return content_hash in self.entries.get(namespace, {})
+
+    def record(self, namespace: str, content_hash: str, filename: str, doc_id, clauses: int):
+        with self._lock:
+            self.entries.setdefault(namespace, {})[content_hash] = {
+                "filename": filename,
+                "doc_id": doc_id,
+                "clauses": clauses,
+                "ingested_at": datetime.utcnow().isoformat()
+            }
+            # Written after every file so a crash loses at most the files in flight
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def make_session(parallelism: int = 1) -> requests.Session:
+    """HTTP session whose connection pool fits the number of concurrent uploads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=parallelism, pool_maxsize=parallelism)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def request_with_backoff(session: requests.Session, method: str, url: str, max_retries: int = 5,
+                         base_delay: float = 1.0, **kwargs) -> requests.Response:
+    """Send a request, retrying 429/5xx, connection errors and timeouts with jittered exponential backoff.
+
+    Retrying a timed-out upload is safe: the server returns the existing job for a repeated upload.
+    """
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                return response
+            retry_after = response.headers.get("Retry-After")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else base_delay * 2 ** attempt
+            reason = f"HTTP {response.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            delay = base_delay * 2 ** attempt
+            reason = str(e)
+        delay *= random.uniform(0.8, 1.2)
+        print(f"  {method} {url} failed ({reason}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+
+def wait_for_job(base_url: str, job_id: str, poll_interval: float = 1.0, session: requests.Session = None,
+                 timeout: float = JOB_TIMEOUT) -> dict:
+    """Poll an ingestion job until it is done or failed.
+
+    A job the server no longer knows (404 after a restart or session cleanup), any other
+    error response, or one still running after `timeout` seconds counts as failed.
+    """
+    session = session or requests.Session()
+    deadline = time.monotonic() + timeout
+    while True:
+        response = request_with_backoff(session, "GET", f"{base_url}/jobs/{job_id}")
+        if response.status_code != 200:
+            return {"status": "failed", "error": f"job {job_id}: {response.status_code} - {response.text}"}
+        result = response.json()
+        if result.get("status") in ("done", "failed"):
+            return result
+        if time.monotonic() >= deadline:
+            return {**result, "status": "failed", "error": f"job {job_id} still {result.get('status')} after {timeout:g}s"}
+        time.sleep(poll_interval)
+
+
+def ingest_file(session: requests.Session, file_path: Path, content: bytes, file_type: str,
+                base_url: str, namespace: str, job_timeout: float = JOB_TIMEOUT) -> dict:
+    """Upload one file and wait for its ingestion job to settle."""
+    files_payload = {
+        'file': (file_path.name, content, 'application/octet-stream')
+    }
+    data_payload = {
+        'file_type': file_type,
+        'version': '1.0',
+        'namespace': namespace
+    }
+    response = request_with_backoff(session, "POST", f"{base_url}/upload", files=files_payload, data=data_payload)
+    if response.status_code != 200:
+        return {"status": "failed", "error": f"{response.status_code} - {response.text}"}
+    return wait_for_job(base_url, response.json()["job_id"], session=session, timeout=job_timeout)
+
+
+def process_directory(directory_path: str, file_type: str = "regulation", base_url: str = "http://localhost:8000",
+                      namespace: str = "permanent", parallelism: int = 4, manifest_path: str = None,
+                      job_timeout: float = JOB_TIMEOUT):
     path = Path(directory_path)
     if not path.is_dir():
         print(f"Error: {directory_path} is not a directory.")
@@ -15,35 +138,51 @@ def process_directory(directory_path: str, file_type: str = "regulation", base_u
     files = []
     for ext in extensions:
         files.extend(list(path.glob(f"**/*{ext}")))
-        
-    print(f"Found {len(files)} documents to process in {directory_path}")
 
-    upload_url = f"{base_url}/upload"
+    print(f"Found {len(files)} documents to process in {directory_path} ({parallelism} in parallel)")
+
+    manifest = Manifest(Path(manifest_path) if manifest_path else path / MANIFEST_NAME)
+    session = make_session(parallelism)
+    counts = {"done": 0, "skipped": 0, "failed": 0, "clauses": 0}
+    counts_lock = threading.Lock()
 
-    for i, file_path in enumerate(files):
-        print(f"[{i+1}/{len(files)}] Uploading {file_path.name} to namespace {namespace}...")
-        
+    def process(i, file_path):
         try:
-            with open(file_path, "rb") as f:
-                files_payload = {
-                    'file': (file_path.name, f, 'application/octet-stream')
-                }
-                data_payload = {
-                    'file_type': file_type,
-                    'version': '1.0',
-                    'namespace': namespace
-                }
-                
-                response = requests.post(upload_url, files=files_payload, data=data_payload)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    print(f"  Successfully ingested: {result.get('filename')} (ID: {result.get('doc_id')})")
-                else:
-                    print(f"  Failed to upload {file_path.name}: {response.status_code} - {response.text}")
+            content = file_path.read_bytes()
+            content_hash = hashlib.sha256(content).hexdigest()
+            if manifest.contains(namespace, content_hash):
+                print(f"[{i+1}/{len(files)}] Skipping {file_path.name}: already ingested into {namespace}")
+                return "skipped", 0
 
+            print(f"[{i+1}/{len(files)}] Uploading {file_path.name} to namespace {namespace}...")
+            result = ingest_file(session, file_path, content, file_type, base_url, namespace, job_timeout)
+            if result.get("status") != "done":
+                print(f"  Failed to ingest {file_path.name}: {result.get('error')}")
+                return "failed", 0
+
+            clauses = result.get("clauses_embedded", 0)
+            manifest.record(namespace, content_hash, file_path.name, result.get("doc_id"), clauses)
+            print(f"  Successfully ingested: {result.get('filename')} (ID: {result.get('doc_id')}, {clauses} clauses)")
+            return "done", clauses
         except Exception as e:
             print(f"  Error processing {file_path.name}: {e}")
+            return "failed", 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        futures = [pool.submit(process, i, file_path) for i, file_path in enumerate(files)]
+        for future in as_completed(futures):
+            outcome, clauses = future.result()
+            with counts_lock:
+                counts[outcome] += 1
+                counts["clauses"] += clauses
+    elapsed = time.perf_counter() - start
+
+    print(f"\nIngested {counts['done']} files ({counts['clauses']} clauses), "
+          f"skipped {counts['skipped']}, failed {counts['failed']} in {elapsed:.1f}s")
+    if elapsed > 0:
+        print(f"Throughput: {counts['done'] / elapsed:.2f} files/s, {counts['clauses'] / elapsed:.1f} clauses/s")
+    return counts
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Batch ingest documents into Pinecone via API.")
@@ -51,14 +190,19 @@ if __name__ == "__main__":
     parser.add_argument("--type", type=str, default="regulation", help="Type of documents (regulation or customer)")
     parser.add_argument("--url", type=str, default="http://localhost:8000", help="Backend API base URL")
     parser.add_argument("--namespace", type=str, default="permanent", help="Pinecone namespace (session or permanent)")
-    
+    parser.add_argument("--parallelism", type=int, default=4, help="Number of files uploaded concurrently")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help=f"Manifest of already ingested files (default: <dir>/{MANIFEST_NAME})")
+    parser.add_argument("--job-timeout", type=float, default=JOB_TIMEOUT,
+                        help="Seconds to wait for each file's ingestion job before counting it as failed")
+
     args = parser.parse_args()
-    
+
     # Check if backend is reachable
     try:
         requests.get(args.url)
     except:
         print(f"Warning: Backend at {args.url} seems unreachable. Make sure the server is running.")
-        
-    process_directory(args.dir, args.type, args.url, args.namespace)
+
+    process_directory(args.dir, args.type, args.url, args.namespace, args.parallelism, args.manifest, args.job_timeout)
     print("\nBatch ingestion complete!")
@@ -0,0 +1,382 @@
+"""
+Micro-benchmarks for the backend data paths. Run from the repo root, e.g.:
+
+    python -m backend.benchmark store --sizes 1000 10000 100000
+    python -m backend.benchmark backends --clauses 5000
+    python -m backend.benchmark retrieval --latency 0.05
+    python -m backend.benchmark scheduler --capacity 8 --latency 0.2
+    python -m backend.benchmark pipeline --clauses 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+
+def bench_store(sizes, lookups: int = 2000, docs_per_session: int = 10):
+    """Clause/result lookup cost on the in-memory store as a session grows."""
+    from .models import InMemoryStore
+
+    print(f"{'clauses':>10} {'by_doc_and_id':>16} {'by_document':>14} {'results':>12}   (avg per lookup)")
+    for size in sizes:
+        store = InMemoryStore()
+        sid = "bench"
+        doc_ids = [store.add_document(sid, f"doc_{i}.pdf", "regulation").id for i in range(docs_per_session)]
+        per_doc = size // docs_per_session
+        for doc_id in doc_ids:
+            for i in range(per_doc):
+                store.add_clause(sid, doc_id, f"{i // 100}.{i % 100}", f"clause text {doc_id}-{i}", 1, "MUST")
+        assessment = store.add_assessment(sid, doc_ids[0], doc_ids[1])
+        for i in range(min(per_doc, 1000)):
+            store.add_result(sid, assessment.id, i + 1, i + 1, "COMPLIANT", "LOW", "", "", 1.0)
+
+        keys = []
+        for _ in range(lookups):
+            i = random.randrange(per_doc)
+            keys.append((random.choice(doc_ids), f"{i // 100}.{i % 100}"))
+        start = time.perf_counter()
+        for doc_id, label in keys:
+            store.get_clause_by_doc_and_clause_id(sid, doc_id, label)
+        by_key = (time.perf_counter() - start) / lookups
+
+        rounds = 20
+        start = time.perf_counter()
+        for _ in range(rounds):
+            store.get_clauses_by_document(sid, doc_ids[0])
+        by_doc = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            store.get_results_by_assessment(sid, assessment.id)
+        results = (time.perf_counter() - start) / rounds
+
+        print(f"{size:>10} {by_key * 1e6:>13.2f} us {by_doc * 1e3:>11.3f} ms {results * 1e3:>9.3f} ms")
+
+
+def bench_backends(clauses: int = 5000, chunk_size: int = 64, dim: int = 768):
+    """Upload and /assess store throughput: InMemoryStore vs SQLStore.
+
+    Upload = add_document + add_clauses/set_clause_vectors per ingest chunk.
+    Assess = the store calls /assess and /report make per customer clause
+    (vector lookup, regulation clause lookup by label, add_result, result read-back).
+    Embedding, vector search and LLM time are excluded.
+    """
+    from .models import InMemoryStore
+    from .sql_store import SQLStore
+
+    vector = [random.random() for _ in range(dim)]
+    parsed = [
+        {"clause_id": f"{i // 100}.{i % 100}", "text": f"clause text {i} " * 20, "page_number": 1 + i // 10,
+         "severity": "MUST"}
+        for i in range(clauses)
+    ]
+
+    def upload(store, sid, name):
+        doc = store.add_document(sid, name, "regulation")
+        for i in range(0, len(parsed), chunk_size):
+            stored = store.add_clauses(sid, doc.id, parsed[i:i + chunk_size])
+            store.set_clause_vectors(sid, {c.id: vector for c in stored})
+        return doc.id
+
+    def assess(store, sid, customer_doc_id, regulation_doc_id):
+        assessment = store.add_assessment(sid, customer_doc_id, regulation_doc_id)
+        for c in store.get_clauses_by_document(sid, customer_doc_id):
+            store.get_clause_vector(sid, c.id)
+            reg = store.get_clause_by_doc_and_clause_id(sid, regulation_doc_id, c.clause_id)
+            store.add_result(sid, assessment.id, c.id, reg.id, "COMPLIANT", "LOW", "reasoning", "evidence", 0.9)
+        for r in store.get_results_by_assessment(sid, assessment.id):
+            store.get_clause(sid, r.customer_clause_id)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [("memory", InMemoryStore()), ("sqlite", SQLStore(os.path.join(tmp, "bench_store.db")))]
+        print(f"{'backend':>8} {'upload clauses/s':>18} {'assess clauses/s':>18}   ({clauses} clauses, dim {dim})")
+        for name, store in backends:
+            sid = "bench"
+            start = time.perf_counter()
+            reg_id = upload(store, sid, "regulation.pdf")
+            cust_id = upload(store, sid, "customer.pdf")
+            upload_rate = 2 * clauses / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            assess(store, sid, cust_id, reg_id)
+            assess_rate = clauses / (time.perf_counter() - start)
+            print(f"{name:>8} {upload_rate:>18,.0f} {assess_rate:>18,.0f}")
+
+
+class MockVectorStore:
+    """Stands in for PineconeVectorStore: each query costs one simulated network round-trip."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.queries = 0
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, namespace=None, filter=None):
+        from langchain_core.documents import Document
+        self.queries += 1
+        time.sleep(self.latency)
+        return [
+            (Document(page_content=f"{namespace} clause {i}", metadata={"doc_id": "1", "clause_id": str(i)}),
+             1.0 - i / 100)
+            for i in range(k)
+        ]
+
+
+def bench_retrieval(latency: float = 0.05, queries: int = 20):
+    """retrieve_by_vector latency against a mock Pinecone index, session only vs. session + KB."""
+    from .rag import rag_engine
+
+    saved = rag_engine.use_pinecone, rag_engine.vector_store
+    mock = MockVectorStore(latency)
+    rag_engine.use_pinecone, rag_engine.vector_store = True, mock
+    vector = [random.random() for _ in range(768)]
+    try:
+        print(f"{'namespaces':>12} {'avg latency':>14}   (mock round-trip {latency * 1e3:.0f} ms)")
+        for use_kb in (False, True):
+            start = time.perf_counter()
+            for _ in range(queries):
+                rag_engine.retrieve_by_vector(vector, top_k=5, use_kb=use_kb, session_id="bench")
+            elapsed = (time.perf_counter() - start) / queries
+            print(f"{2 if use_kb else 1:>12} {elapsed * 1e3:>11.1f} ms")
+    finally:
+        rag_engine.use_pinecone, rag_engine.vector_store = saved
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class FakeProvider:
+    """Stands in for the LLM API: fixed latency, and a 429 for any call beyond `capacity` in flight."""
+
+    def __init__(self, capacity: int, latency: float):
+        self.capacity = capacity
+        self.latency = latency
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def complete(self):
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            await asyncio.sleep(self.latency / 10)
+            raise RateLimited("429 RESOURCE_EXHAUSTED")
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.latency * random.uniform(0.8, 1.2))
+        finally:
+            self.in_flight -= 1
+
+
+def bench_scheduler(capacity: int = 8, latency: float = 0.2, bulk_calls: int = 200, interactive_calls: int = 10):
+    """One large assessment and one small interactive session sharing the LLM through the scheduler.
+
+    The provider accepts `capacity` concurrent calls and answers 429 beyond that; the scheduler
+    starts at twice that limit and has to find it.
+    """
+    from .scheduler import ProviderScheduler
+
+    async def run(mode: str):
+        provider = FakeProvider(capacity, latency)
+        scheduler = ProviderScheduler("bench-llm", max_concurrency=capacity * 2, session_concurrency=capacity * 2,
+                                      tokens_per_minute=0, base_delay=latency)
+
+        async def session(name: str, calls: int, delay: float = 0.0):
+            await asyncio.sleep(delay)
+            start = time.perf_counter()
+            if mode == "scheduler":
+                jobs = [scheduler.run(provider.complete, session_id=name) for _ in range(calls)]
+            else:
+                # What /assess did before: a private Semaphore(10) per request and no retries
+                semaphore = asyncio.Semaphore(10)
+
+                async def call():
+                    async with semaphore:
+                        await provider.complete()
+                jobs = [call() for _ in range(calls)]
+            outcomes = await asyncio.gather(*jobs, return_exceptions=True)
+            failed = sum(isinstance(o, Exception) for o in outcomes)
+            return name, calls, failed, time.perf_counter() - start
+
+        start = time.perf_counter()
+        sessions = await asyncio.gather(
+            session("bulk", bulk_calls), session("interactive", interactive_calls, delay=latency * 5)
+        )
+        elapsed = time.perf_counter() - start
+        for name, calls, failed, seconds in sessions:
+            print(f"{mode:>10} {name:>12} {calls:>6} {failed:>7} {seconds:>9.2f}s")
+        return provider, scheduler, elapsed
+
+    print(f"{'mode':>10} {'session':>12} {'calls':>6} {'failed':>7} {'wall time':>10}   "
+          f"(provider capacity {capacity}, latency {latency * 1e3:.0f} ms)")
+    asyncio.run(run("semaphore"))
+    provider, scheduler, elapsed = asyncio.run(run("scheduler"))
+    stats = scheduler.stats()
+    total = bulk_calls + interactive_calls
+    print(f"\nScheduler: {total / elapsed:.1f} calls/s (provider maximum {capacity / latency:.1f}), "
+          f"{provider.rejected} 429s, {stats['retries']} retries, final concurrency limit {stats['limit']}")
+
+
+PIPELINE_TOPICS = ["access control", "data retention", "incident response", "encryption", "audit logging",
+                   "vendor management", "backup", "change management", "network segmentation", "training"]
+
+
+def _pipeline_pdf(path: str, clauses: int, customer: bool):
+    """Regulation clauses, or customer clauses paraphrasing most of them (every 7th one unrelated)."""
+    from reportlab.pdfgen import canvas
+
+    pdf = canvas.Canvas(path)
+    y = 800
+    for i in range(clauses):
+        topic = PIPELINE_TOPICS[i % len(PIPELINE_TOPICS)]
+        if not customer:
+            text = f"{i // 20 + 1}.{i % 20 + 1} The operator shall implement {topic} controls for system {i} and review them yearly."
+        elif i % 7 == 6:
+            text = f"{i // 20 + 1}.{i % 20 + 1} Staff may bring pets to the office on Fridays in building {i}."
+        else:
+            text = f"{i // 20 + 1}.{i % 20 + 1} We implement {topic} controls for system {i} and review them every year."
+        pdf.drawString(40, y, text)
+        y -= 18
+        if y < 60:
+            pdf.showPage()
+            y = 800
+    pdf.save()
+
+
+def _sse_events(response):
+    event = None
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, line[len("data: "):]
+
+
+def bench_pipeline(clauses: int = 300, batch_size: int = 1, chats: int = 5):
+    """Upload, /assess/stream and /chat/stream through the real app over HTTP, with the local
+    providers (EMBEDDING_PROVIDER/LLM_PROVIDER=local) so no network access is needed.
+
+    Caches and FAISS indexes are kept in memory so every run starts cold, and uploaded files are
+    stored in a temporary STORAGE_DIR that is removed afterwards. The local providers' behaviour
+    is set with the LOCAL_* env vars (see providers.py).
+    """
+    storage_dir = tempfile.mkdtemp(prefix="bench-storage-")
+    os.environ["STORAGE_DIR"] = storage_dir
+    for var, value in [("EMBEDDING_PROVIDER", "local"), ("LLM_PROVIDER", "local"), ("PINECONE_API_KEY", ""),
+                       ("EMBEDDING_CACHE_PATH", ""), ("VERDICT_CACHE_PATH", ""), ("PARSE_CACHE_PATH", ""),
+                       ("FAISS_INDEX_DIR", "")]:
+        os.environ.setdefault(var, value)
+    import socket
+    import threading
+    import httpx
+    import uvicorn
+    from .main import app
+    from .scheduler import llm_scheduler
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base = f"http://127.0.0.1:{port}"
+    headers = {"X-Session-ID": f"bench-{random.getrandbits(32):08x}"}
+    lines = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp, httpx.Client(base_url=base, headers=headers, timeout=600) as client:
+            # Upload: parse + embed + index, until both ingestion jobs are done
+            doc_ids = {}
+            start = time.perf_counter()
+            for file_type in ("regulation", "customer"):
+                path = os.path.join(tmp, f"bench_{file_type}.pdf")
+                _pipeline_pdf(path, clauses, customer=file_type == "customer")
+                with open(path, "rb") as f:
+                    job_id = client.post("/upload", files={"file": (os.path.basename(path), f, "application/pdf")},
+                                         data={"file_type": file_type}).json()["job_id"]
+                while (job := client.get(f"/jobs/{job_id}").json())["status"] not in ("done", "failed"):
+                    time.sleep(0.05)
+                doc_ids[file_type] = job["doc_id"]
+            elapsed = time.perf_counter() - start
+            lines.append(f"upload   {2 * clauses} clauses in {elapsed:.2f}s ({2 * clauses / elapsed:,.0f} clauses/s)")
+
+            # Assess: time to the first streamed verdict and to the last
+            start, first, stats = time.perf_counter(), None, {}
+            with client.stream("POST", "/assess/stream", data={
+                "customer_doc_id": doc_ids["customer"], "regulation_doc_id": doc_ids["regulation"],
+                "batch_size": batch_size
+            }) as response:
+                for event, data in _sse_events(response):
+                    if event == "result" and first is None:
+                        first = time.perf_counter() - start
+                    elif event in ("done", "error"):
+                        stats = json.loads(data)
+            elapsed = time.perf_counter() - start
+            lines.append(f"assess   {clauses} clauses in {elapsed:.2f}s ({clauses / elapsed:,.1f} clauses/s), "
+                         f"first verdict after {first or 0:.2f}s, {stats.get('stats', stats).get('llm_calls')} LLM calls")
+
+            # Chat: time to first token and to the full answer
+            ttft, total = [], []
+            for i in range(chats):
+                start, first = time.perf_counter(), None
+                topic = PIPELINE_TOPICS[i % len(PIPELINE_TOPICS)]
+                with client.stream("POST", "/chat/stream", data={"query": f"What is required for {topic}?"}) as response:
+                    for event, _ in _sse_events(response):
+                        if event == "token" and first is None:
+                            first = time.perf_counter() - start
+                ttft.append(first or 0.0)
+                total.append(time.perf_counter() - start)
+            lines.append(f"chat     {chats} questions: first token {sum(ttft) / chats:.2f}s, "
+                         f"full answer {sum(total) / chats:.2f}s (avg)")
+            scheduler = llm_scheduler.stats()
+            lines.append(f"llm      {scheduler['calls']} calls, {scheduler['rate_limited']} rate limited, "
+                         f"{scheduler['retries']} retries, concurrency limit {scheduler['limit']}")
+    finally:
+        server.should_exit = True
+        thread.join()
+        shutil.rmtree(storage_dir, ignore_errors=True)
+    print("\n" + "\n".join(lines))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend micro-benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    store_parser = sub.add_parser("store", help="InMemoryStore lookup cost vs. session size")
+    store_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    store_parser.add_argument("--lookups", type=int, default=2000)
+
+    backends_parser = sub.add_parser("backends", help="Upload and /assess store throughput, memory vs. SQLite")
+    backends_parser.add_argument("--clauses", type=int, default=5000)
+    backends_parser.add_argument("--chunk-size", type=int, default=64)
+
+    retrieval_parser = sub.add_parser("retrieval", help="Multi-namespace retrieval latency against a mock index")
+    retrieval_parser.add_argument("--latency", type=float, default=0.05, help="Simulated round-trip in seconds")
+    retrieval_parser.add_argument("--queries", type=int, default=20)
+
+    scheduler_parser = sub.add_parser("scheduler", help="LLM scheduler fairness and 429 handling against a fake provider")
+    scheduler_parser.add_argument("--capacity", type=int, default=8, help="Concurrent calls the fake provider accepts")
+    scheduler_parser.add_argument("--latency", type=float, default=0.2, help="Seconds per fake call")
+    scheduler_parser.add_argument("--bulk-calls", type=int, default=200)
+    scheduler_parser.add_argument("--interactive-calls", type=int, default=10)
+
+    pipeline_parser = sub.add_parser("pipeline", help="Upload/assess/chat throughput and latency with local providers")
+    pipeline_parser.add_argument("--clauses", type=int, default=300, help="Clauses per generated document")
+    pipeline_parser.add_argument("--batch-size", type=int, default=1, help="/assess batch_size")
+    pipeline_parser.add_argument("--chats", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "store":
+        bench_store(args.sizes, args.lookups)
+    elif args.command == "backends":
+        bench_backends(args.clauses, args.chunk_size)
+    elif args.command == "retrieval":
+        bench_retrieval(args.latency, args.queries)
+    elif args.command == "scheduler":
+        bench_scheduler(args.capacity, args.latency, args.bulk_calls, args.interactive_calls)
+    elif args.command == "pipeline":
+        bench_pipeline(args.clauses, args.batch_size, args.chats)
@@ -0,0 +1,171 @@
+"""
+In-process bulk ingestion for bootstrapping or rebuilding a namespace (usually the
+permanent KB) without going through /upload. Run from the repo root, e.g.:
+
+    python -m backend.bulk_ingest --dir regulations/ --namespace permanent --rebuild
+
+PDFs are parsed on a process pool, clauses from all files are pooled into large
+embedding batches embedded concurrently, and the vectors are bulk-upserted.
+"""
+import os
+import time
+import argparse
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+from .models import store
+from .rag import rag_engine, PERMANENT_NAMESPACE
+from .ingestion import parse_docx, parse_xlsx
+from .pdf_parsing import parse_pdf_file
+
+BULK_PARSE_WORKERS = int(os.getenv("BULK_PARSE_WORKERS", str(os.cpu_count() or 1)))
+BULK_EMBED_BATCH = int(os.getenv("BULK_EMBED_BATCH", "256"))
+BULK_EMBED_CONCURRENCY = int(os.getenv("BULK_EMBED_CONCURRENCY", "4"))
+# Pinecone accepts up to ~2MB per upsert request; 100 x 768-dim vectors stays well under it
+BULK_UPSERT_BATCH = int(os.getenv("BULK_UPSERT_BATCH", "100"))
+
+EXTENSIONS = [".pdf", ".docx", ".xlsx"]
+
+
+def find_files(directory_path: str) -> List[Path]:
+    path = Path(directory_path)
+    files = []
+    for ext in EXTENSIONS:
+        files.extend(path.glob(f"**/*{ext}"))
+    return sorted(files)
+
+
+def _parse_other(path: Path) -> List[Dict]:
+    content = path.read_bytes()
+    if path.suffix.lower() == ".docx":
+        return parse_docx(content, path.name)
+    return parse_xlsx(content, path.name)
+
+
+def bulk_ingest(files: List[Path], namespace: str = PERMANENT_NAMESPACE, file_type: str = "regulation",
+                session_id: str = "default", version: str = "1.0", rebuild: bool = False,
+                parse_workers: int = BULK_PARSE_WORKERS, embed_batch: int = BULK_EMBED_BATCH,
+                embed_concurrency: int = BULK_EMBED_CONCURRENCY) -> Dict:
+    """Parse, embed and upsert `files` into `namespace`. Returns throughput stats."""
+    if rebuild:
+        print(f"DEBUG: Rebuilding namespace {namespace}")
+        rag_engine.clear_index(namespace=namespace)
+
+    stats = {"files": 0, "failed": 0, "clauses": 0}
+    clause_counts: Dict[int, int] = {}  # doc_id -> clauses registered, taken back out of stats if it is removed
+    failed_docs = set()
+    start = time.perf_counter()
+
+    # Clauses waiting for the next embedding batch: (stored clause, vector-store record)
+    pending: List = []
+    embed_pool = ThreadPoolExecutor(max_workers=embed_concurrency, thread_name_prefix="bulk-embed")
+    embed_futures = {}
+
+    def flush(force: bool = False):
+        nonlocal pending
+        while len(pending) >= embed_batch or (force and pending):
+            batch, pending = pending[:embed_batch], pending[embed_batch:]
+            texts = [record["text"] for _, record in batch]
+            embed_futures[embed_pool.submit(rag_engine.embeddings.embed_documents, texts)] = batch
+
+    def register(path: Path, clauses: List[Dict]):
+        doc = store.add_document(session_id=session_id, filename=path.name, file_type=file_type, version=version,
+                                 namespace=namespace)
+        stored = store.add_clauses(session_id, doc.id, clauses)
+        for clause, c in zip(stored, clauses):
+            pending.append((clause, {
+                "clause_id": c['clause_id'],
+                "doc_id": doc.id,
+                "doc_name": doc.filename,
+                "text": c['text'],
+                "page_number": c['page_number']
+            }))
+        clause_counts[doc.id] = len(clauses)
+        stats["files"] += 1
+        stats["clauses"] += len(clauses)
+        print(f"DEBUG: Parsed {path.name}: {len(clauses)} clauses (doc_id {doc.id})")
+        flush()
+
+    pdfs = [f for f in files if f.suffix.lower() == ".pdf"]
+    others = [f for f in files if f.suffix.lower() != ".pdf"]
+
+    # spawn, as in pdf_parsing: the embedding pool threads are already running
+    with ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn")) as parse_pool:
+        parse_futures = {parse_pool.submit(parse_pdf_file, str(f)): f for f in pdfs}
+        for path in others:
+            try:
+                register(path, _parse_other(path))
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"DEBUG: Failed to parse {path.name}: {e}")
+        for future in as_completed(parse_futures):
+            path = parse_futures[future]
+            try:
+                register(path, future.result())
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"DEBUG: Failed to parse {path.name}: {e}")
+    parse_seconds = time.perf_counter() - start
+    flush(force=True)
+
+    # Upsert in completion order; batches from different files may interleave
+    for future in as_completed(embed_futures):
+        batch = embed_futures[future]
+        try:
+            vectors = future.result()
+        except Exception as e:
+            print(f"DEBUG: Embedding batch of {len(batch)} clauses failed: {e}")
+            failed_docs.update(record["doc_id"] for _, record in batch)
+            continue
+        records = [record for _, record in batch]
+        rag_engine.upsert_vectors(records, vectors, session_id=session_id, namespace=namespace,
+                                  batch_size=BULK_UPSERT_BATCH)
+        store.set_clause_vectors(session_id, {clause.id: vector for (clause, _), vector in zip(batch, vectors)})
+    embed_pool.shutdown()
+
+    # A document with any unembedded clause is removed entirely, so a rerun can ingest it cleanly.
+    # Vectors go first: their id in a shared namespace is looked up from the stored document
+    for doc_id in failed_docs:
+        try:
+            rag_engine.delete_document_vectors(doc_id, session_id=session_id, namespace=namespace)
+        except Exception as e:
+            print(f"DEBUG: Vectors of failed doc_id {doc_id} could not be removed from {namespace}: {e}")
+        store.delete_document(session_id, doc_id)
+        stats["files"] -= 1
+        stats["clauses"] -= clause_counts[doc_id]
+        stats["failed"] += 1
+    rag_engine.persist_index(session_id=session_id, namespace=namespace)
+
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "seconds": round(elapsed, 2),
+        "parse_seconds": round(parse_seconds, 2),
+        "files_per_second": round(stats["files"] / elapsed, 2) if elapsed else 0.0,
+        "clauses_per_second": round(stats["clauses"] / elapsed, 1) if elapsed else 0.0,
+    })
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a directory of documents in-process (no HTTP).")
+    parser.add_argument("--dir", type=str, required=True, help="Directory containing documents")
+    parser.add_argument("--type", type=str, default="regulation", help="Type of documents (regulation or customer)")
+    parser.add_argument("--namespace", type=str, default=PERMANENT_NAMESPACE, help="Target vector namespace")
+    parser.add_argument("--session", type=str, default="default", help="Store session the documents are registered in")
+    parser.add_argument("--rebuild", action="store_true", help="Clear the namespace before ingesting")
+    parser.add_argument("--parse-workers", type=int, default=BULK_PARSE_WORKERS)
+    parser.add_argument("--embed-batch", type=int, default=BULK_EMBED_BATCH)
+    parser.add_argument("--embed-concurrency", type=int, default=BULK_EMBED_CONCURRENCY)
+
+    args = parser.parse_args()
+    files = find_files(args.dir)
+    print(f"Found {len(files)} documents to ingest into namespace {args.namespace}")
+    stats = bulk_ingest(
+        files, namespace=args.namespace, file_type=args.type, session_id=args.session, rebuild=args.rebuild,
+        parse_workers=args.parse_workers, embed_batch=args.embed_batch, embed_concurrency=args.embed_concurrency
+    )
+    print(f"\nIngested {stats['files']} files ({stats['clauses']} clauses), {stats['failed']} failed "
+          f"in {stats['seconds']}s (parsing {stats['parse_seconds']}s)")
+    print(f"Throughput: {stats['files_per_second']} files/s, {stats['clauses_per_second']} clauses/s")
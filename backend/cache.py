@@ -0,0 +1,163 @@
+"""
+Content-addressed caches for expensive AI calls.
+Entries live in a bounded in-memory LRU and are persisted to SQLite so they survive restarts.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def content_key(*parts) -> str:
+    """SHA-256 over the given parts, separated so ("ab", "c") != ("a", "bc")."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    """Short, stable fingerprint of a clause text, used to spot duplicate clauses."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class PersistentLRUCache:
+    """Bounded in-memory LRU in front of an optional SQLite table (key -> BLOB)."""
+
+    def __init__(self, table: str, db_path: Optional[str] = None, max_entries: int = 10000):
+        self.table = table
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._conn.commit()
+
+    def _remember(self, key: str, value: bytes):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+
+            if missing and self._conn is not None:
+                # Chunked to stay under SQLite's bound-parameter limit
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self._conn.execute(
+                        f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                    for key, value in rows:
+                        found[key] = value
+                        self._remember(key, value)
+
+            hit_count = sum(1 for key in keys if key in found)
+            self.hits += hit_count
+            self.misses += len(keys) - hit_count
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, bytes]):
+        if not items:
+            return
+        with self._lock:
+            for key, value in items.items():
+                self._remember(key, value)
+            if self._conn is not None:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", list(items.items())
+                )
+                self._conn.commit()
+
+    def put(self, key: str, value: bytes):
+        self.put_many({key: value})
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "memory_entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "persistent": self._conn is not None,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only calls the underlying model for texts it has never seen.
+
+    Keys hash (model, dimensionality, task, text), so changing the model or
+    output size never returns stale vectors.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, dimensionality: int,
+                 cache: PersistentLRUCache):
+        self.underlying = underlying
+        self.model = model
+        self.dimensionality = dimensionality
+        self.cache = cache
+
+    def _key(self, task: str, text: str) -> str:
+        return content_key(self.model, self.dimensionality, task, text)
+
+    @staticmethod
+    def _encode(vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        return array("f", blob).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("document", t) for t in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each distinct uncached text once, even if it repeats within the batch
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                pending.setdefault(key, text)
+
+        fresh: Dict[str, List[float]] = {}
+        if pending:
+            vectors = self.underlying.embed_documents(list(pending.values()))
+            fresh = dict(zip(pending.keys(), vectors))
+            self.cache.put_many({key: self._encode(v) for key, v in fresh.items()})
+
+        return [fresh[key] if key in fresh else self._decode(cached[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        blob = self.cache.get(key)
+        if blob is not None:
+            return self._decode(blob)
+        vector = self.underlying.embed_query(text)
+        self.cache.put(key, self._encode(vector))
+        return vector
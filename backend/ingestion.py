@@ -1,9 +1,24 @@
-from pypdf import PdfReader
 from io import BytesIO
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Tuple
+import os
 import re
+import json
+import hashlib
 from .models import store
 from .rag import rag_engine
+from .cache import PersistentLRUCache, content_key
+from .pdf_parsing import parse_pdf_clauses, iter_pdf_clauses, CLAUSE_PATTERN
+from .progress import IngestProgress
+from .scheduler import current_session
+
+# Clauses are embedded and upserted in chunks of this size while a document is parsed
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "64"))
+
+# Parsed clauses per file content hash: re-uploading a file (in any session) skips parsing,
+# and its embeddings are then all embedding-cache hits. Set PARSE_CACHE_PATH="" for memory only.
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", "backend/data/parse_cache.db")
+PARSE_CACHE_SIZE = int(os.getenv("PARSE_CACHE_SIZE", "256"))
+parse_cache = PersistentLRUCache("parsed_documents", db_path=PARSE_CACHE_PATH or None, max_entries=PARSE_CACHE_SIZE)
 
 # Try to import python-docx
 try:
@@ -42,45 +57,8 @@ def parse_xlsx(file_content: bytes, filename: str) -> List[Dict]:
 
 
 def parse_pdf(file_content: bytes, filename: str) -> List[Dict]:
-    """Parse PDF and extract clauses."""
-    reader = PdfReader(BytesIO(file_content))
-    clauses = []
-    
-    # regex for clause-like patterns
-    pattern = r'(?m)^(\d+\.[\d\.]+|[A-Z]\.[\d\.]+|Article\s+\d+:?)\s+(.*)'
-    
-    for page_num, page in enumerate(reader.pages):
-        page_text = page.extract_text()
-        if not page_text:
-            continue
-        
-        matches = list(re.finditer(pattern, page_text))
-        
-        if not matches:
-            # Fallback: split by double newlines on this page
-            paragraphs = page_text.split("\n\n")
-            for i, p in enumerate(paragraphs):
-                if len(p.strip()) > 20:
-                    clauses.append({
-                        "clause_id": f"P-{page_num}-{i}",
-                        "text": p.strip(),
-                        "page_number": page_num + 1,
-                        "severity": "UNKNOWN"
-                    })
-        else:
-            for i in range(len(matches)):
-                start = matches[i].start()
-                end = matches[i+1].start() if i + 1 < len(matches) else len(page_text)
-                clause_id = matches[i].group(1).strip()
-                text = page_text[start:end].strip()
-                clauses.append({
-                    "clause_id": clause_id,
-                    "text": text,
-                    "page_number": page_num + 1,
-                    "severity": "MUST" if "shall" in text.lower() or "must" in text.lower() else "SHOULD"
-                })
-    
-    return clauses
+    """Parse PDF and extract clauses (large files are parsed on a process pool)."""
+    return parse_pdf_clauses(file_content)
 
 
 def parse_docx(file_content: bytes, filename: str) -> List[Dict]:
@@ -144,49 +122,129 @@ def parse_docx(file_content: bytes, filename: str) -> List[Dict]:
     return clauses
 
 
-def parse_document(file_content: bytes, filename: str, file_type: str, version: str = "1.0", namespace: str = None, session_id: str = None) -> int:
+def iter_document_clauses(file_content: bytes, filename: str) -> Iterator[Tuple[int, int, List[Dict]]]:
     """
-    Parse a document (PDF, DOCX, or XLSX) and store in memory.
-    Returns the document ID.
+    Return an iterator of (pages_done, total_pages, clauses) for a PDF, DOCX or XLSX file.
+    PDFs are streamed page by page; DOCX and XLSX are parsed in one step.
     """
-    # Determine file type and parse
     filename_lower = filename.lower()
     
     if filename_lower.endswith('.pdf'):
-        clauses = parse_pdf(file_content, filename)
+        return iter_pdf_clauses(file_content)
     elif filename_lower.endswith('.docx'):
-        clauses = parse_docx(file_content, filename)
+        return iter([(1, 1, parse_docx(file_content, filename))])
     elif filename_lower.endswith('.xlsx'):
-        clauses = parse_xlsx(file_content, filename)
+        return iter([(1, 1, parse_xlsx(file_content, filename))])
     else:
         raise ValueError(f"Unsupported file type: {filename}")
-    
-    # Add document to in-memory store
-    doc = store.add_document(session_id=session_id, filename=filename, file_type=file_type, version=version)
-    
-    # Add clauses to store and prepare for vector ingestion
-    ingest_clauses = []
-    for c in clauses:
-        store.add_clause(
-            session_id=session_id,
-            document_id=doc.id,
-            clause_id=c['clause_id'],
-            text=c['text'],
-            page_number=c['page_number'],
-            severity=c['severity']
-        )
-        ingest_clauses.append({
+
+
+def _parse_cache_key(file_content: bytes, filename: str) -> str:
+    # Parsing depends on the extension and the clause pattern as well as the bytes
+    extension = os.path.splitext(filename.lower())[1]
+    return content_key(hashlib.sha256(file_content).hexdigest(), extension, CLAUSE_PATTERN)
+
+
+def _recording(pages: Iterator[Tuple[int, int, List[Dict]]], parsed: List[Dict], page_count: List[int]):
+    """Pass pages through while keeping a copy of every clause for the parse cache."""
+    for pages_done, total_pages, page_clauses in pages:
+        parsed.extend(page_clauses)
+        page_count[0] = total_pages
+        yield pages_done, total_pages, page_clauses
+
+
+def _ingest_chunk(chunk: List[Dict], doc, session_id: str, namespace: str) -> int:
+    """Store a chunk of parsed clauses and embed/upsert them. Returns the chunk size."""
+    stored_clauses = store.add_clauses(session_id, doc.id, chunk)
+    ingest_clauses = [
+        {
             "status": "INGESTED", # Temporary placeholder
             "clause_id": c['clause_id'],
             "doc_id": doc.id,
-            "doc_name": filename,  # Include filename for chat responses
+            "doc_name": doc.filename,  # Include filename for chat responses
             "text": c['text'],
             "page_number": c['page_number']
-        })
+        }
+        for c in chunk
+    ]
     
     # Ingest all documents into Vector DB (not just regulations)
     # This enables chatting with any uploaded document
-    if ingest_clauses:
-        rag_engine.ingest_documents(ingest_clauses, session_id=session_id, namespace=namespace)
+    vectors = rag_engine.ingest_documents(ingest_clauses, session_id=session_id, namespace=namespace)
+    # Keep the embeddings so /assess can query with them instead of re-embedding the text
+    store.set_clause_vectors(session_id, {stored.id: vector for stored, vector in zip(stored_clauses, vectors)})
+    return len(chunk)
+
+
+def parse_document(file_content: bytes, filename: str, file_type: str, version: str = "1.0", namespace: str = None,
+                   session_id: str = None, progress: Optional[IngestProgress] = None) -> int:
+    """
+    Parse a document (PDF, DOCX, or XLSX) and store in memory.
+    Clauses are stored, embedded and upserted in chunks of INGEST_CHUNK_SIZE as
+    pages are parsed, so the first clauses are searchable before the document finishes.
+    Returns the document ID. `progress` is marked failed here, but left for the caller
+    to mark done once it has finished with the document.
+    """
+    # Embedding calls below are queued under the uploading session
+    current_session.set(session_id or "default")
+    cache_key = _parse_cache_key(file_content, filename)
+    cached = parse_cache.get(cache_key)
+    parsed: List[Dict] = []
+    page_count = [0]
+    if cached is not None:
+        entry = json.loads(cached)
+        print(f"DEBUG: {filename} was parsed before ({len(entry['clauses'])} clauses), reusing the parse")
+        pages = iter([(entry["pages"], entry["pages"], entry["clauses"])])
+    else:
+        pages = _recording(iter_document_clauses(file_content, filename), parsed, page_count)
     
+    # Add document to in-memory store
+    doc = store.add_document(session_id=session_id, filename=filename, file_type=file_type, version=version,
+                             namespace=namespace)
+    if progress:
+        progress.update(doc_id=doc.id)
+    
+    pending: List[Dict] = []
+    embedded = 0
+    try:
+        for pages_done, total_pages, page_clauses in pages:
+            pending.extend(page_clauses)
+            if progress:
+                progress.update(
+                    status="parsing", pages_parsed=pages_done, total_pages=total_pages,
+                    clauses_parsed=progress.clauses_parsed + len(page_clauses)
+                )
+            while len(pending) >= INGEST_CHUNK_SIZE:
+                chunk, pending = pending[:INGEST_CHUNK_SIZE], pending[INGEST_CHUNK_SIZE:]
+                if progress:
+                    progress.update(status="embedding")
+                embedded += _ingest_chunk(chunk, doc, session_id, namespace)
+                if progress:
+                    progress.update(clauses_embedded=embedded)
+        
+        if pending:
+            if progress:
+                progress.update(status="embedding")
+            embedded += _ingest_chunk(pending, doc, session_id, namespace)
+    except Exception as e:
+        # Roll back the partially ingested document so a failed upload leaves nothing behind
+        print(f"DEBUG: Ingestion of {filename} failed after {embedded} clauses: {e}")
+        # Vectors first: their id in a shared namespace is looked up from the stored document
+        error = str(e)
+        try:
+            rag_engine.delete_document_vectors(doc.id, session_id=session_id, namespace=namespace)
+            store.delete_document(session_id, doc.id)
+        except Exception as cleanup_error:
+            # Keep the document so deleting it later retries the vector cleanup
+            error += f" (its vectors could not be removed: {cleanup_error}; delete document {doc.id} to retry)"
+            print(f"DEBUG: Rollback of {filename} (doc_id {doc.id}) failed: {cleanup_error}")
+        if progress:
+            progress.update(status="failed", error=error)
+        raise
+    
+    if cached is None:
+        parse_cache.put(cache_key, json.dumps({"pages": page_count[0], "clauses": parsed}).encode("utf-8"))
+    rag_engine.persist_index(session_id=session_id, namespace=namespace)
+    if progress:
+        progress.update(clauses_embedded=embedded)
     return doc.id
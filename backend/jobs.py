@@ -0,0 +1,202 @@
+"""
+Background ingestion queue: /upload stores the bytes and returns a job id right away,
+and a fixed number of in-process workers parse and embed queued files.
+"""
+import os
+import uuid
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from dataclasses import dataclass, field
+
+from .models import store
+from .ingestion import parse_document
+from .rag import rag_engine
+from .progress import IngestProgress
+from .workers import ingest_pool, file_io_pool, run_blocking, INGEST_WORKERS
+
+# Number of uploads parsed/embedded concurrently
+INGEST_QUEUE_CONCURRENCY = int(os.getenv("INGEST_QUEUE_CONCURRENCY", str(INGEST_WORKERS)))
+# Finished (done or failed) jobs are forgotten this long after they finish; their status can no
+# longer be polled and re-uploading the same file ingests it again
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+
+@dataclass
+class IngestJob:
+    id: str
+    session_id: str
+    filename: str
+    file_type: str
+    version: str
+    namespace: Optional[str]
+    dedup_key: str
+    upload_path: str
+    progress: IngestProgress
+    attempts: int = 0
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def status(self) -> str:
+        return self.progress.status
+
+    def to_dict(self) -> Dict:
+        data = self.progress.to_dict()
+        data.pop("upload_id", None)
+        data.update({
+            "job_id": self.id,
+            "file_type": self.file_type,
+            "version": self.version,
+            "namespace": self.namespace,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat(),
+        })
+        return data
+
+
+class IngestionQueue:
+    """In-process job queue with bounded concurrency and idempotent submission.
+
+    A job is identified by (session, namespace, type, version, filename, content hash).
+    Re-submitting a queued, running or finished job returns the existing job instead of
+    ingesting the file again; only failed jobs (which roll back their partial document)
+    are re-queued. Finished jobs are evicted JOB_RETENTION_SECONDS after they finish.
+    """
+
+    def __init__(self, storage_dir: str, concurrency: int = INGEST_QUEUE_CONCURRENCY):
+        self.storage_dir = storage_dir
+        self.upload_dir = os.path.join(storage_dir, "uploads")
+        self.concurrency = concurrency
+        self.jobs: Dict[str, IngestJob] = {}
+        self._by_key: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self):
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+
+    def get(self, session_id: str, job_id: str) -> Optional[IngestJob]:
+        job = self.jobs.get(job_id)
+        return job if job and job.session_id == session_id else None
+
+    def discard_session(self, session_id: str):
+        with self._lock:
+            for job_id in [j.id for j in self.jobs.values() if j.session_id == session_id]:
+                job = self.jobs.pop(job_id)
+                self._by_key.pop(job.dedup_key, None)
+
+    def _evict_finished(self):
+        """Forget jobs finished longer than JOB_RETENTION_SECONDS ago. Caller holds _lock."""
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_RETENTION_SECONDS)
+        expired = [j for j in self.jobs.values() if j.status in ("done", "failed") and j.progress.updated_at < cutoff]
+        for job in expired:
+            del self.jobs[job.id]
+            if self._by_key.get(job.dedup_key) == job.id:
+                del self._by_key[job.dedup_key]
+        if expired:
+            print(f"DEBUG: Evicted {len(expired)} finished ingestion jobs")
+
+    def _is_reusable(self, job: IngestJob) -> bool:
+        if job.status == "failed":
+            return False
+        if job.status == "done":
+            # The document may have been deleted since; then the file must be ingested again
+            return store.get_document(job.session_id, job.progress.doc_id) is not None
+        return True
+
+    async def submit(self, session_id: str, filename: str, file_type: str, version: str,
+                     namespace: Optional[str], content: bytes) -> IngestJob:
+        content_hash = hashlib.sha256(content).hexdigest()
+        dedup_key = "|".join([session_id, namespace or "", file_type, version, filename, content_hash])
+
+        with self._lock:
+            self._evict_finished()
+            existing = self.jobs.get(self._by_key.get(dedup_key, ""))
+            if existing and self._is_reusable(existing):
+                print(f"DEBUG: Upload of {filename} matches job {existing.id} ({existing.status}), not re-queuing")
+                return existing
+
+            job_id = existing.id if existing else str(uuid.uuid4())
+            job = IngestJob(
+                id=job_id,
+                session_id=session_id,
+                filename=filename,
+                file_type=file_type,
+                version=version,
+                namespace=namespace,
+                dedup_key=dedup_key,
+                upload_path=os.path.join(self.upload_dir, job_id),
+                progress=IngestProgress(upload_id=job_id, filename=filename, status="queued"),
+                attempts=existing.attempts if existing else 0
+            )
+            self.jobs[job_id] = job
+            self._by_key[dedup_key] = job_id
+
+        await run_blocking(file_io_pool, _write_file, job.upload_path, content)
+        await self._queue.put(job_id)
+        print(f"DEBUG: Queued ingestion job {job_id} for {filename} (session {session_id})")
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job is not None:
+                    await self._run(job)
+            except Exception as e:
+                print(f"DEBUG: Ingestion worker error for job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestJob):
+        job.attempts += 1
+        job.progress.update(status="parsing", error=None)
+        try:
+            content = await run_blocking(file_io_pool, _read_file, job.upload_path)
+            doc_id = await run_blocking(
+                ingest_pool, parse_document, content, job.filename, job.file_type, job.version,
+                namespace=job.namespace, session_id=job.session_id, progress=job.progress
+            )
+            # Keep the original under the {doc_id}_{filename} name used for downloads
+            try:
+                os.replace(job.upload_path, os.path.join(self.storage_dir, f"{doc_id}_{job.filename}"))
+            except Exception:
+                # Without its original the document can't be downloaded; drop it so a retry starts clean
+                await run_blocking(ingest_pool, _discard_document, job, doc_id)
+                raise
+            # Only now is the document complete, original included
+            job.progress.update(status="done")
+            print(f"DEBUG: Job {job.id} ingested {job.filename}, doc_id: {doc_id} in session {job.session_id}")
+        except Exception as e:
+            # Any partially ingested document has been rolled back (by parse_document or above)
+            job.progress.update(status="failed", error=str(e))
+            if os.path.exists(job.upload_path):
+                os.remove(job.upload_path)
+            print(f"DEBUG: Job {job.id} failed: {e}")
+
+
+def _discard_document(job: IngestJob, doc_id: int):
+    # Vectors first: their id in a shared namespace is looked up from the stored document
+    rag_engine.delete_document_vectors(doc_id, session_id=job.session_id, namespace=job.namespace)
+    store.delete_document(job.session_id, doc_id)
+
+
+def _write_file(path: str, content: bytes):
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
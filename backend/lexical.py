@@ -0,0 +1,153 @@
+"""
+In-process BM25 index over clause texts, one per vector namespace. Catches exact
+identifiers ("A.5.1", "IEC 62109", "10kV") that embeddings blur, and answers
+clause-id lookups without an embedding call.
+"""
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from .cache import text_hash
+
+# Identifiers keep their inner dots/dashes: "A.5.1", "62109-1", "10kv"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+# Clause references as produced by the parsers' CLAUSE_PATTERN
+CLAUSE_REF_PATTERN = re.compile(r"(?i)\b(\d+\.\d+(?:\.\d+)*|[A-Z]\.\d+(?:\.\d+)*|Article\s+\d+)\b")
+# Words that may surround a clause id in a pure lookup query ("what does clause 4.2 say?")
+LOOKUP_FILLER = {
+    "what", "does", "do", "say", "says", "said", "is", "in", "the", "of", "show", "me", "clause", "clauses",
+    "section", "article", "requirement", "text", "about", "and", "find", "get", "give", "please", "read"
+}
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _normalize_clause_id(clause_id: str) -> str:
+    return " ".join(clause_id.lower().rstrip(".:").split())
+
+
+def clause_lookup_ids(query: str) -> List[str]:
+    """Clause ids a query asks for, if it is nothing but a clause-id lookup; else []."""
+    ids = [_normalize_clause_id(m) for m in CLAUSE_REF_PATTERN.findall(query)]
+    if not ids:
+        return []
+    rest = CLAUSE_REF_PATTERN.sub(" ", query)
+    if any(token not in LOOKUP_FILLER for token in tokenize(rest)):
+        return []
+    return ids
+
+
+class LexicalIndex:
+    """BM25 over the clauses of one namespace, with per-document filtering."""
+
+    def __init__(self):
+        self.entries: Dict[int, Tuple[Document, int]] = {}  # entry id -> (document, token count)
+        self.postings: Dict[str, Dict[int, int]] = {}  # term -> {entry id: term frequency}
+        self.by_doc: Dict[str, Set[int]] = {}
+        self.by_clause_id: Dict[str, Set[int]] = {}
+        self._hashes: Dict[str, Set[str]] = {}
+        self._next_id = 0
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self.entries)
+
+    def add(self, texts: List[str], metadatas: List[Dict]):
+        with self._lock:
+            for text, meta in zip(texts, metadatas):
+                doc_id = str(meta["doc_id"])
+                fingerprint = meta.get("text_hash") or text_hash(text)
+                hashes = self._hashes.setdefault(doc_id, set())
+                if fingerprint in hashes:
+                    continue
+                hashes.add(fingerprint)
+
+                entry_id = self._next_id
+                self._next_id += 1
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                self.entries[entry_id] = (Document(page_content=text, metadata=meta), length)
+                self._total_length += length
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, {})[entry_id] = tf
+                self.by_doc.setdefault(doc_id, set()).add(entry_id)
+                self.by_clause_id.setdefault(_normalize_clause_id(str(meta.get("clause_id", ""))), set()).add(entry_id)
+
+    def drop_document(self, doc_id: str):
+        with self._lock:
+            self._hashes.pop(doc_id, None)
+            for entry_id in self.by_doc.pop(doc_id, set()):
+                doc, length = self.entries.pop(entry_id)
+                self._total_length -= length
+                for term in set(tokenize(doc.page_content)):
+                    postings = self.postings.get(term)
+                    if postings is not None:
+                        postings.pop(entry_id, None)
+                        if not postings:
+                            del self.postings[term]
+                ids = self.by_clause_id.get(_normalize_clause_id(str(doc.metadata.get("clause_id", ""))))
+                if ids is not None:
+                    ids.discard(entry_id)
+
+    def search(self, query: str, k: int, doc_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """Top-k (document, BM25 score) pairs for the query."""
+        terms = set(tokenize(query))
+        with self._lock:
+            if not self.entries or not terms:
+                return []
+            allowed = self.by_doc.get(doc_id, set()) if doc_id else None
+            n = len(self.entries)
+            avg_length = self._total_length / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for entry_id, tf in postings.items():
+                    if allowed is not None and entry_id not in allowed:
+                        continue
+                    length = self.entries[entry_id][1]
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                    scores[entry_id] = scores.get(entry_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+            ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+            return [(self.entries[entry_id][0], score) for entry_id, score in ranked]
+
+    def lookup_clause_ids(self, clause_ids: List[str], doc_id: Optional[str] = None) -> List[Document]:
+        """Clauses whose id is exactly one of `clause_ids`, in the order asked."""
+        with self._lock:
+            allowed = self.by_doc.get(doc_id, set()) if doc_id else None
+            found = []
+            for clause_id in clause_ids:
+                for entry_id in sorted(self.by_clause_id.get(clause_id, ())):
+                    if allowed is None or entry_id in allowed:
+                        found.append(self.entries[entry_id][0])
+            return found
+
+
+def fusion_key(doc: Document) -> Tuple[str, str]:
+    """Identity of a clause across rankings: its document and text."""
+    return str(doc.metadata.get("doc_id")), doc.metadata.get("text_hash") or text_hash(doc.page_content)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[Document, float]]], k: int = 60) -> List[Tuple[Document, float]]:
+    """Fuse ranked lists by summing 1 / (k + rank); the same clause in several lists is merged."""
+    fused: Dict[Tuple[str, str], List] = {}
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking, 1):
+            key = fusion_key(doc)
+            if key not in fused:
+                fused[key] = [doc, 0.0]
+            fused[key][1] += 1.0 / (k + rank)
+    return sorted(((doc, score) for doc, score in fused.values()), key=lambda x: x[1], reverse=True)
@@ -1,9 +1,14 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from .models import store, Document, Clause, Assessment, AssessmentResult
-from .ingestion import parse_document
-from .rag import rag_engine
+from .models import store, Document, Clause, Assessment, AssessmentResult, STORE_BACKEND
+from .jobs import IngestionQueue
+from .ingestion import parse_cache
+from .cache import text_hash
+from .pdf_parsing import shutdown_pool as shutdown_pdf_pool
+from .rag import rag_engine, PERMANENT_NAMESPACE
+from .workers import retrieval_pool, render_pool, run_blocking, shutdown_pools
+from .scheduler import current_session, llm_scheduler, embedding_scheduler
 from fastapi.responses import StreamingResponse
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -11,26 +16,30 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 import io
 import os
+import re
+import json
 import asyncio
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from datetime import timedelta
 from fastapi.responses import FileResponse
 import shutil
 
 # Ensure storage directory exists
-STORAGE_DIR = "backend/storage"
+STORAGE_DIR = os.getenv("STORAGE_DIR", "backend/storage")
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
+ingestion_queue = IngestionQueue(STORAGE_DIR)
+
+# Idle sessions are purged after this many minutes; 0 disables purging. Off by default for the
+# SQLite store, whose sessions are meant to outlive a restart (and may sit idle while it is down)
+SESSION_IDLE_MINUTES = int(os.getenv("SESSION_IDLE_MINUTES", "0" if STORE_BACKEND == "sqlite" else "15"))
+
 async def session_cleanup_task():
-    """Background task to clear inactive sessions after 15 minutes."""
+    """Background task to clear sessions idle for more than SESSION_IDLE_MINUTES."""
     while True:
         try:
             await asyncio.sleep(60)  # Check every minute
-            now = datetime.utcnow()
-            sessions_to_purge = []
-            
-            for session_id, session_data in store.sessions.items():
-                if now - session_data.last_activity > timedelta(minutes=15):
-                    sessions_to_purge.append(session_id)
+            sessions_to_purge = store.inactive_sessions(timedelta(minutes=SESSION_IDLE_MINUTES))
             
             for session_id in sessions_to_purge:
                 print(f"DEBUG: Purging inactive session: {session_id}")
@@ -38,6 +47,7 @@ async def session_cleanup_task():
                 rag_engine.clear_index(session_id=session_id)
                 # Clear from memory
                 store.reset(session_id=session_id)
+                ingestion_queue.discard_session(session_id)
                 
                 # Optionally delete physical files for this session
                 # (Files are prefixed with {doc_id}_ but we don't easily know session_id from filename)
@@ -48,15 +58,26 @@ async def session_cleanup_task():
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Start cleanup task
-    cleanup_task = asyncio.create_task(session_cleanup_task())
+    cleanup_task = None
+    if SESSION_IDLE_MINUTES > 0:
+        # Downtime doesn't count as idleness: persisted sessions get a fresh idle window
+        store.reset_idle_timers()
+        cleanup_task = asyncio.create_task(session_cleanup_task())
+    # Before serving: hybrid retrieval needs the BM25 side of documents ingested before a restart
+    await run_blocking(retrieval_pool, rag_engine.rebuild_lexical_indexes)
+    await ingestion_queue.start()
     yield
-    cleanup_task.cancel()
+    if cleanup_task:
+        cleanup_task.cancel()
+    await ingestion_queue.stop()
+    shutdown_pools()
+    shutdown_pdf_pool()
 
 app = FastAPI(title="3D Compliance Intelligence API", lifespan=lifespan)
 
-# Dependency to get session ID
-def get_sid(x_session_id: str = Header("default")):
+# Dependency to get session ID; LLM and embedding calls made for the request are queued under it
+async def get_sid(x_session_id: str = Header("default")):
+    current_session.set(x_session_id)
     return x_session_id
 
 # CORS setup for React frontend
@@ -88,15 +109,16 @@ async def upload_file(
     
     print(f"DEBUG: Uploading {file.filename} as {file_type} to session {session_id}")
     content = await file.read()
-    doc_id = parse_document(content, file.filename, file_type, version, namespace=namespace, session_id=session_id)
-    
-    # Save the file to physical storage
-    file_path = os.path.join(STORAGE_DIR, f"{doc_id}_{file.filename}")
-    with open(file_path, "wb") as f:
-        f.write(content)
-        
-    print(f"DEBUG: Uploaded {file.filename}, doc_id: {doc_id} in session {session_id}")
-    return {"doc_id": doc_id, "filename": file.filename}
+    # Parsing and embedding run on the ingestion queue; poll /jobs/{job_id} for the outcome
+    job = await ingestion_queue.submit(session_id, file.filename, file_type, version, namespace, content)
+    return {"job_id": job.id, "status": job.status, "filename": file.filename, "doc_id": job.progress.doc_id}
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str, session_id: str = Depends(get_sid)):
+    job = ingestion_queue.get(session_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 @app.get("/documents/{doc_id}/download")
 def download_document(doc_id: int, session_id: str = Depends(get_sid)):
@@ -142,7 +164,12 @@ def delete_document(doc_id: int, session_id: str = Depends(get_sid)):
     for a in assessments:
         store.delete_assessment(session_id, a.id)
     
-    # Delete document and its clauses
+    # Delete the document's vectors (wherever it was ingested), then the document and its clauses.
+    # If the vectors can't be deleted the document is kept, so the request can be retried
+    try:
+        rag_engine.delete_document_vectors(doc_id, session_id=session_id, namespace=doc.namespace)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Could not delete the document's vectors: {e}")
     store.delete_document(session_id, doc_id)
     
     return {"message": "Document deleted"}
@@ -156,23 +183,35 @@ def update_document_type(doc_id: int, file_type: str = Form(...), session_id: st
     if file_type not in ["regulation", "customer"]:
         raise HTTPException(status_code=400, detail="Invalid file type")
     
-    doc.file_type = file_type
+    store.update_document_type(session_id, doc_id, file_type)
     return {"message": "Document type updated", "file_type": file_type}
 
 @app.post("/reset")
 def reset_data(session_id: str = Depends(get_sid)):
     store.reset(session_id)
     rag_engine.clear_index(session_id=session_id)
+    ingestion_queue.discard_session(session_id)
     return {"message": f"Data cleared for session {session_id}"}
 
-@app.post("/assess")
-async def assess_compliance(
-    customer_doc_id: int = Form(...),
-    regulation_doc_id: int = Form(...),
-    use_kb: bool = Form(False),
-    session_id: str = Depends(get_sid)
-):
+# Upper bound on clauses sent to the LLM in a single batched prompt
+MAX_ASSESS_BATCH_SIZE = int(os.getenv("MAX_ASSESS_BATCH_SIZE", "25"))
+# Best-match similarity below which a customer clause is recorded as NO_MATCH without an LLM call
+# (0 disables pruning; cosine similarities of related clauses are typically well above 0.5)
+NO_MATCH_THRESHOLD = float(os.getenv("NO_MATCH_THRESHOLD", "0.0"))
+# Upper bound on regulation clauses packed into one analysis context
+MAX_CONTEXT_CLAUSES = int(os.getenv("MAX_CONTEXT_CLAUSES", "5"))
+# Extra context clauses must score within this margin of the best match
+CONTEXT_SCORE_MARGIN = float(os.getenv("CONTEXT_SCORE_MARGIN", "0.05"))
+
+def _start_assessment(session_id: str, customer_doc_id: int, regulation_doc_id: int, batch_size: int, context_k: int,
+                      threshold: float, use_kb: bool):
+    """Validate an /assess request and record the assessment as running."""
     print(f"DEBUG: Assessing compliance for session {session_id}. Customer Doc: {customer_doc_id}, Reg Doc: {regulation_doc_id}")
+    if not 1 <= batch_size <= MAX_ASSESS_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"batch_size must be between 1 and {MAX_ASSESS_BATCH_SIZE}")
+    if not 1 <= context_k <= MAX_CONTEXT_CLAUSES:
+        raise HTTPException(status_code=400, detail=f"context_k must be between 1 and {MAX_CONTEXT_CLAUSES}")
+
     customer_clauses = store.get_clauses_by_document(session_id, customer_doc_id)
     print(f"DEBUG: Found {len(customer_clauses)} clauses in customer doc")
     
@@ -183,75 +222,414 @@ async def assess_compliance(
     assessment = store.add_assessment(
         session_id=session_id,
         customer_doc_id=customer_doc_id, 
-        regulation_doc_id=regulation_doc_id
+        regulation_doc_id=regulation_doc_id,
+        status="running",
+        total_clauses=len(customer_clauses),
+        threshold=threshold,
+        context_k=context_k,
+        use_kb=use_kb
     )
+    return assessment, customer_clauses
+
+def _version_numbers(version: Optional[str]) -> tuple:
+    """Numeric parts of a version label, so "1.10" sorts after "1.9"; () if it has none."""
+    return tuple(int(n) for n in re.findall(r"\d+", version or ""))
+
+def _is_earlier_version(doc: Document, current: Document) -> bool:
+    """Whether `doc` precedes `current`: by parsed version, by upload order when either lacks one or they tie."""
+    doc_version, current_version = _version_numbers(doc.version), _version_numbers(current.version)
+    if doc_version and current_version and doc_version != current_version:
+        return doc_version < current_version
+    return doc.id < current.id
+
+def _previous_version(session_id: str, assessment: Assessment, previous_doc_id: Optional[int]) -> Optional[Assessment]:
+    """Latest complete assessment of the previous version of the customer document.
+
+    The previous version is `previous_doc_id` if given, else the closest earlier version (see
+    _is_earlier_version) with the same filename and type that has been assessed against the same
+    regulation. Only an assessment made with the same threshold, context_k and use_kb qualifies:
+    verdicts produced under other settings are not carried forward.
+    """
+    if previous_doc_id is None:
+        current = store.get_document(session_id, assessment.customer_doc_id)
+        if not current:
+            return None
+        earlier = [d for d in store.get_all_documents(session_id)
+                   if d.id != current.id and d.filename == current.filename and d.file_type == current.file_type
+                   and _is_earlier_version(d, current)]
+        candidates = [d.id for d in sorted(earlier, key=lambda d: (_version_numbers(d.version), d.id), reverse=True)]
+    else:
+        candidates = [previous_doc_id]
+    settings = (assessment.threshold, assessment.context_k, assessment.use_kb)
+    for doc_id in candidates:
+        for base in reversed(store.get_assessments_by_doc(session_id, doc_id)):
+            if (base.customer_doc_id == doc_id and base.regulation_doc_id == assessment.regulation_doc_id
+                    and base.status == "complete" and (base.threshold, base.context_k, base.use_kb) == settings):
+                return base
+    return None
+
+def _carry_forward(session_id: str, assessment: Assessment, customer_clauses, base: Assessment):
+    """Copy `base`'s verdicts for clauses unchanged since that version into `assessment`.
+
+    A clause is unchanged if a clause of the previous version has the same clause_id and text.
+    Returns (copied results, clauses that still need to be evaluated).
+    """
+    previous_clauses = {c.id: c for c in store.get_clauses_by_document(session_id, base.customer_doc_id)}
+    previous_results: Dict[tuple, List[AssessmentResult]] = {}
+    for r in store.get_results_by_assessment(session_id, base.id):
+        c = previous_clauses.get(r.customer_clause_id)
+        if c:
+            previous_results.setdefault((c.clause_id, text_hash(c.text)), []).append(r)
+
+    reused, remaining = [], []
+    for c_clause in customer_clauses:
+        candidates = previous_results.get((c_clause.clause_id, text_hash(c_clause.text)))
+        if not candidates:
+            remaining.append(c_clause)
+            continue
+        # Repeated identical clauses each take their own previous verdict
+        r = candidates.pop(0)
+        reused.append(store.add_result(
+            session_id=session_id,
+            assessment_id=assessment.id,
+            customer_clause_id=c_clause.id,
+            regulation_clause_id=r.regulation_clause_id,
+            status=r.status,
+            risk=r.risk,
+            reasoning=r.reasoning,
+            evidence_text=r.evidence_text,
+            confidence=r.confidence
+        ))
+    print(f"DEBUG: Assessment {assessment.id}: reused {len(reused)} results from assessment {base.id}, "
+          f"re-evaluating {len(remaining)} clauses")
+    return reused, remaining
+
+def _prepare_clauses(session_id: str, assessment: Assessment, customer_clauses, incremental: bool,
+                     previous_doc_id: Optional[int], stats: Dict):
+    """Clauses to evaluate, plus results carried forward when `incremental` finds a previous version."""
+    base = _previous_version(session_id, assessment, previous_doc_id) if incremental else None
+    if incremental:
+        stats["base_assessment_id"] = base.id if base else None
+    if not base:
+        return [], customer_clauses
+    return _carry_forward(session_id, assessment, customer_clauses, base)
+
+# Running assessments; referenced here so they finish even if a streaming client disconnects
+_assessment_tasks = set()
+
+def _run_assessment(session_id: str, assessment: Assessment, customer_clauses, use_kb: bool,
+                    batch_size: int, context_k: int, threshold: float, stats: Dict,
+                    reused: List[AssessmentResult] = ()) -> asyncio.Queue:
+    """Start matching and analysing `customer_clauses` in the background.
+
+    Each saved AssessmentResult is put on the returned queue as soon as it exists (`reused`
+    ones, already saved, first), followed by None when the assessment is over. `stats` is filled in and the assessment's status set
+    ("complete" or "failed") before the None is queued.
+    """
+    regulation_doc_id = assessment.regulation_doc_id
+    results = asyncio.Queue()
+    for result in reused:
+        results.put_nowait(result)
+    # LLM calls and verdict cache hits made for this assessment (filled in by rag_engine)
+    usage: Dict[str, int] = {}
     
-    import asyncio
-    semaphore = asyncio.Semaphore(10)
-    
-    async def process_clause(c_clause):
-        async with semaphore:
-            # Retrieve similar regulation clauses
-            similar_docs = rag_engine.retrieve_similar_clauses(c_clause.text, doc_id=regulation_doc_id, use_kb=use_kb, session_id=session_id)
-            
-            if not similar_docs:
-                return None
-                
-            best_match_doc, score = similar_docs[0]
-            reg_clause_id_val = best_match_doc.metadata['clause_id']
-            reg_clause = store.get_clause_by_doc_and_clause_id(session_id, regulation_doc_id, reg_clause_id_val)
-            
-            if not reg_clause:
-                return None
-                
-            # Run LLM Analysis
-            analysis = await rag_engine.analyze_compliance(c_clause.text, reg_clause.text)
-            
-            # Defensive logging
-            if not isinstance(analysis, dict) or 'status' not in analysis:
-                print(f"DEBUG: CRITICAL ERROR - Analysis returned invalid object: {analysis}")
-            
-            try:
-                return store.add_result(
-                    session_id=session_id,
-                    assessment_id=assessment.id,
-                    customer_clause_id=c_clause.id,
-                    regulation_clause_id=reg_clause.id,
-                    status=analysis.get('status', 'UNKNOWN'),
-                    risk=analysis.get('risk', 'HIGH'),
-                    reasoning=analysis.get('reasoning', 'Analysis failed'),
-                    evidence_text=analysis.get('evidence_text', 'N/A'),
-                    confidence=analysis.get('confidence', 0.0)
-                )
-            except Exception as e:
-                print(f"DEBUG: Error adding result to store: {e}")
-                print(f"DEBUG: Analysis was: {analysis}")
-                return None
-
-    # Process all clauses in parallel with concurrency limit
-    results_raw = await asyncio.gather(*[process_clause(c) for c in customer_clauses])
-    results = [r for r in results_raw if r is not None]
+    # Retrieval is bounded by retrieval_pool; LLM calls wait for llm_scheduler, shared by every request
+    async def match_clause(c_clause):
+        # Retrieve similar regulation clauses, reusing the ingest-time embedding when available.
+        # Hits come in hybrid (vector + BM25) order but scores are cosine similarities either way,
+        # so the thresholds below apply to both
+        query_vector = store.get_clause_vector(session_id, c_clause.id)
+        if query_vector is None:
+            query_vector = await run_blocking(retrieval_pool, rag_engine.embeddings.embed_query, c_clause.text)
+        similar_docs = await run_blocking(
+            retrieval_pool, rag_engine.retrieve_by_vector, query_vector,
+            top_k=max(context_k, 5), doc_id=regulation_doc_id, use_kb=use_kb, session_id=session_id,
+            query_text=c_clause.text
+        )
+        
+        if not similar_docs:
+            return None
         
-    return {"assessment_id": assessment.id, "results_count": len(results)}
+        best_score = max(score for _, score in similar_docs)
+        reg_clauses = []
+        for match_doc, score in similar_docs:
+            if len(reg_clauses) == context_k:
+                break
+            # Lexical evidence reorders near-ties; it doesn't admit clauses far less similar than the best
+            if score < best_score - CONTEXT_SCORE_MARGIN:
+                continue
+            reg_clause = store.get_clause_by_doc_and_clause_id(session_id, regulation_doc_id, match_doc.metadata['clause_id'])
+            if reg_clause and reg_clause not in reg_clauses:
+                reg_clauses.append(reg_clause)
+        
+        if not reg_clauses:
+            return None
+        return c_clause, reg_clauses, best_score
+
+    def save_result(c_clause, reg_clause, analysis):
+        # Defensive logging
+        if not isinstance(analysis, dict) or 'status' not in analysis:
+            print(f"DEBUG: CRITICAL ERROR - Analysis returned invalid object: {analysis}")
+        
+        try:
+            result = store.add_result(
+                session_id=session_id,
+                assessment_id=assessment.id,
+                customer_clause_id=c_clause.id,
+                regulation_clause_id=reg_clause.id,
+                status=analysis.get('status', 'UNKNOWN'),
+                risk=analysis.get('risk', 'HIGH'),
+                reasoning=analysis.get('reasoning', 'Analysis failed'),
+                evidence_text=analysis.get('evidence_text', 'N/A'),
+                confidence=analysis.get('confidence', 0.0)
+            )
+        except Exception as e:
+            print(f"DEBUG: Error adding result to store: {e}")
+            print(f"DEBUG: Analysis was: {analysis}")
+            return
+        results.put_nowait(result)
+
+    def regulation_context(reg_clauses):
+        # The best match comes first; neighbours that scored almost as well follow it
+        return "\n\n".join(r.text for r in reg_clauses)
+
+    async def analyze_batch(batch):
+        # Run LLM Analysis; batches of several clauses share one prompt
+        if len(batch) == 1:
+            c_clause, reg_clauses = batch[0]
+            analyses = {str(c_clause.id): await rag_engine.analyze_compliance(
+                c_clause.text, regulation_context(reg_clauses), usage=usage
+            )}
+        else:
+            analyses = await rag_engine.analyze_compliance_batch(
+                [(str(c.id), c.text, regulation_context(r)) for c, r in batch], usage=usage
+            )
+        for c, r in batch:
+            save_result(c, r[0], analyses.get(str(c.id), {}))
+
+    async def run():
+        # Clauses are analysed as soon as they are matched (a batch as soon as it fills up),
+        # so the first verdicts don't wait for the whole document to be matched
+        matched, no_match, analyzed = 0, 0, 0
+        pending, batches = [], []
+        try:
+            for next_match in asyncio.as_completed([match_clause(c) for c in customer_clauses]):
+                match = await next_match
+                if match is None:
+                    continue
+                c_clause, reg_clauses, best_score = match
+                matched += 1
+                # Clauses whose best match is below the threshold have no counterpart in the regulation: no LLM call
+                if best_score < threshold:
+                    no_match += 1
+                    save_result(c_clause, reg_clauses[0], _no_match_analysis(threshold))
+                    continue
+                analyzed += 1
+                pending.append((c_clause, reg_clauses))
+                if len(pending) == batch_size:
+                    batches.append(asyncio.create_task(analyze_batch(pending)))
+                    pending = []
+            if pending:
+                batches.append(asyncio.create_task(analyze_batch(pending)))
+            await asyncio.gather(*batches)
+            store.set_assessment_status(session_id, assessment.id, "complete")
+        except Exception as e:
+            print(f"DEBUG: Assessment {assessment.id} failed: {e}")
+            store.set_assessment_status(session_id, assessment.id, "failed")
+            stats["error"] = str(e)
+        finally:
+            stats.update({
+                "customer_clauses": len(customer_clauses) + len(reused),
+                "reused": len(reused),
+                "reevaluated": len(customer_clauses),
+                "unmatched": len(customer_clauses) - matched,
+                "no_match": no_match,
+                "analyzed": analyzed,
+                "batches": len(batches),
+                # Actual LLM invocations, including split batches and retried calls
+                "llm_calls": usage.get("llm_calls", 0),
+                "verdict_cache_hits": usage.get("verdict_cache_hits", 0),
+                "llm_calls_saved_by_pruning": no_match,
+                # One LLM call per matched clause, as without pruning, batching or the verdict cache
+                "llm_calls_baseline": matched,
+                # Retried and split batches can take more calls than the baseline; that counts as no saving
+                "llm_calls_saved": max(0, matched - usage.get("llm_calls", 0)),
+                "threshold": threshold,
+                "context_k": context_k
+            })
+            print(f"DEBUG: Assessment {assessment.id} pruning: {stats}")
+            results.put_nowait(None)
+
+    task = asyncio.create_task(run())
+    _assessment_tasks.add(task)
+    task.add_done_callback(_assessment_tasks.discard)
+    return results
+
+@app.post("/assess")
+async def assess_compliance(
+    customer_doc_id: int = Form(...),
+    regulation_doc_id: int = Form(...),
+    use_kb: bool = Form(False),
+    batch_size: int = Form(1),
+    context_k: int = Form(1),
+    min_score: Optional[float] = Form(None),
+    incremental: bool = Form(False),
+    previous_doc_id: Optional[int] = Form(None),
+    session_id: str = Depends(get_sid)
+):
+    """Match each customer clause to the regulation and analyse it with the LLM.
+
+    With `incremental`, verdicts for clauses unchanged since the previous version of the customer
+    document (`previous_doc_id`, or the closest earlier version with the same filename) are copied
+    forward if it was assessed with the same threshold, context_k and use_kb; only added or
+    modified clauses are retrieved and analysed.
+    """
+    threshold = NO_MATCH_THRESHOLD if min_score is None else min_score
+    assessment, customer_clauses = _start_assessment(session_id, customer_doc_id, regulation_doc_id, batch_size, context_k,
+                                                     threshold, use_kb)
+    stats = {}
+    reused, to_evaluate = _prepare_clauses(session_id, assessment, customer_clauses, incremental, previous_doc_id, stats)
+    results = _run_assessment(session_id, assessment, to_evaluate, use_kb, batch_size, context_k, threshold, stats, reused)
+    
+    results_count = 0
+    while await results.get() is not None:
+        results_count += 1
+    if "error" in stats:
+        raise HTTPException(status_code=500, detail=f"Assessment {assessment.id} failed: {stats['error']}")
+    return {"assessment_id": assessment.id, "results_count": results_count, "stats": stats}
+
+@app.post("/assess/stream")
+async def assess_compliance_stream(
+    customer_doc_id: int = Form(...),
+    regulation_doc_id: int = Form(...),
+    use_kb: bool = Form(False),
+    batch_size: int = Form(1),
+    context_k: int = Form(1),
+    min_score: Optional[float] = Form(None),
+    incremental: bool = Form(False),
+    previous_doc_id: Optional[int] = Form(None),
+    session_id: str = Depends(get_sid)
+):
+    """Same as /assess, streamed as server-sent events while results are produced.
+
+    Events: `started` ({"assessment_id", "total_clauses"}), one `result` per saved verdict,
+    then `done` ({"assessment_id", "results_count", "stats"}) or `error`. The assessment keeps
+    running if the client disconnects; /graph shows its progress either way.
+    """
+    threshold = NO_MATCH_THRESHOLD if min_score is None else min_score
+    assessment, customer_clauses = _start_assessment(session_id, customer_doc_id, regulation_doc_id, batch_size, context_k,
+                                                     threshold, use_kb)
+    stats = {}
+    reused, to_evaluate = _prepare_clauses(session_id, assessment, customer_clauses, incremental, previous_doc_id, stats)
+    results = _run_assessment(session_id, assessment, to_evaluate, use_kb, batch_size, context_k, threshold, stats, reused)
+
+    async def events():
+        yield _sse("started", {"assessment_id": assessment.id, "total_clauses": assessment.total_clauses})
+        results_count = 0
+        while (result := await results.get()) is not None:
+            results_count += 1
+            c_clause = store.get_clause(session_id, result.customer_clause_id)
+            reg_clause = store.get_clause(session_id, result.regulation_clause_id)
+            yield _sse("result", {
+                "completed": results_count,
+                "customer_clause_id": result.customer_clause_id,
+                "customer_clause": c_clause.clause_id if c_clause else None,
+                "regulation_clause_id": result.regulation_clause_id,
+                "regulation_clause": reg_clause.clause_id if reg_clause else None,
+                "status": result.status,
+                "risk": result.risk,
+                "confidence": result.confidence
+            })
+        if "error" in stats:
+            yield _sse("error", {"assessment_id": assessment.id, "detail": stats["error"]})
+        else:
+            yield _sse("done", {"assessment_id": assessment.id, "results_count": results_count, "stats": stats})
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _no_match_analysis(threshold: float) -> Dict:
+    return {
+        "status": "NO_MATCH",
+        "risk": "LOW",
+        "reasoning": f"No regulation clause is similar enough to this clause (similarity below {threshold:.2f}); not analyzed.",
+        "evidence_text": "N/A",
+        "confidence": 0.0
+    }
 
 @app.get("/debug/vector-store")
 def debug_vector_store(session_id: str = Depends(get_sid)):
+    counts = store.session_counts(session_id)
     info = {
-        "vector_store_exists": rag_engine.vector_store is not None,
-        "total_documents": len(store.get_session(session_id).documents),
-        "total_clauses": len(store.get_session(session_id).clauses),
+        "vector_store_exists": rag_engine.has_index(session_id=session_id),
+        "total_documents": counts["documents"],
+        "total_clauses": counts["clauses"],
         "session_id": session_id
     }
     
-    if rag_engine.vector_store is not None:
-        try:
-            # Note: This is a hacky way to check size, might not be accurate for Pinecone
-            info["vector_store_size"] = "Dynamic (Pinecone)"
-        except Exception as e:
-            info["vector_store_error"] = str(e)
+    if rag_engine.use_pinecone:
+        # Note: Pinecone namespace sizes are not tracked locally
+        info["vector_store_size"] = "Dynamic (Pinecone)"
+    else:
+        info["vector_store_size"] = rag_engine.index_size(session_id=session_id)
+        info["permanent_kb_size"] = rag_engine.index_size(namespace=PERMANENT_NAMESPACE)
     
     return info
 
+@app.get("/debug/memory")
+def debug_memory(session_id: str = Depends(get_sid)):
+    return {
+        "session_id": session_id,
+        "store": store.memory_report(session_id),
+        "vector_index": rag_engine.memory_report(session_id=session_id)
+    }
+
+@app.get("/debug/scheduler")
+def debug_scheduler():
+    return {"llm": llm_scheduler.stats(), "embeddings": embedding_scheduler.stats()}
+
+@app.get("/debug/cache")
+def debug_cache():
+    return {
+        "embeddings": rag_engine.embedding_cache.stats(),
+        "verdicts": rag_engine.verdict_cache.stats(),
+        "parsed_documents": parse_cache.stats()
+    }
+
+def _chat_references(similar_docs, session_id: str) -> List[Dict]:
+    """File, clause and page of each retrieved clause, numbered for citation mapping."""
+    references = []
+    for i, (d, score) in enumerate(similar_docs, 1):
+        # Fallback to metadata if store is cleared, or for shared namespaces (e.g. permanent KB),
+        # whose vector doc ids are not this session's document ids
+        doc_id = str(d.metadata.get('doc_id', ''))
+        doc_obj = store.get_document(session_id, int(doc_id)) if doc_id.isdigit() else None
+        references.append({
+            "ref": i,
+            "file": doc_obj.filename if doc_obj else d.metadata.get('doc_name', 'Unknown'),
+            "clause_id": d.metadata.get('clause_id', 'N/A'),
+            "page": d.metadata.get('page_number', 'N/A'),
+            "content": d.page_content
+        })
+    return references
+
+def _chat_context(references: List[Dict]) -> str:
+    # Build context with document NAME (not just ID)
+    return "\n\n---\n\n".join(
+        f"REF [{r['ref']}]:\n"
+        f"File: {r['file']} | Clause: {r['clause_id']} | Page: {r['page']}\n"
+        f"Content: {r['content']}"
+        for r in references
+    )
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+NO_CHAT_CONTEXT_ANSWER = "I couldn't find any relevant information in your documents. Please upload some documents first."
+
 @app.post("/chat")
 async def chat_with_docs(
     query: str = Form(...),
@@ -259,32 +637,61 @@ async def chat_with_docs(
     session_id: str = Depends(get_sid)
 ):
     # Search across documents with optional knowledge base
-    similar_docs = rag_engine.retrieve_similar_clauses(query, top_k=5, use_kb=use_kb, session_id=session_id)
+    similar_docs = await run_blocking(
+        retrieval_pool, rag_engine.retrieve_similar_clauses, query, top_k=5, use_kb=use_kb, session_id=session_id,
+        clause_lookup=True
+    )
     
     if not similar_docs:
-        return {"answer": "I couldn't find any relevant information in your documents. Please upload some documents first."}
-    
-    # Build context with document NAME (not just ID), numbered for citation mapping
-    context_parts = []
-    for i, (d, score) in enumerate(similar_docs, 1):
-        # Fallback to metadata if store is cleared (e.g. for permanent KB)
-        doc_id = d.metadata.get('doc_id')
-        doc_obj = store.get_document(session_id, int(doc_id)) if doc_id else None
-        doc_name = doc_obj.filename if doc_obj else d.metadata.get('doc_name', 'Unknown')
-        clause_id = d.metadata.get('clause_id', 'N/A')
-        page = d.metadata.get('page_number', 'N/A')
-        context_parts.append(
-            f"REF [{i}]:\n"
-            f"File: {doc_name} | Clause: {clause_id} | Page: {page}\n"
-            f"Content: {d.page_content}"
-        )
+        return {"answer": NO_CHAT_CONTEXT_ANSWER}
     
-    context = "\n\n---\n\n".join(context_parts)
+    context = _chat_context(_chat_references(similar_docs, session_id))
     
     # Use LLM to answer the question based on context
-    answer = rag_engine.answer_general_question(query, context)
+    answer = await rag_engine.answer_general_question(query, context)
     return {"answer": answer}
 
+@app.post("/chat/stream")
+async def chat_with_docs_stream(
+    query: str = Form(...),
+    use_kb: bool = Form(False),
+    session_id: str = Depends(get_sid)
+):
+    """Same as /chat, streamed as server-sent events.
+
+    Events: `token` ({"text"}) per generated chunk, then `sources` ({"text", "sources"})
+    with the numbered SOURCES block, then `done`. Failures end the stream with `error`.
+    """
+    similar_docs = await run_blocking(
+        retrieval_pool, rag_engine.retrieve_similar_clauses, query, top_k=5, use_kb=use_kb, session_id=session_id,
+        clause_lookup=True
+    )
+    references = _chat_references(similar_docs, session_id)
+
+    async def events():
+        if not references:
+            yield _sse("token", {"text": NO_CHAT_CONTEXT_ANSWER})
+            yield _sse("done", {})
+            return
+        try:
+            async for text in rag_engine.stream_general_question(query, _chat_context(references)):
+                yield _sse("token", {"text": text})
+        except Exception as e:
+            print(f"DEBUG: Chat stream failed for session {session_id}: {e}")
+            yield _sse("error", {"detail": str(e)})
+            return
+        sources = "\n".join(f"[{r['ref']}] File: {r['file']} | Clause: {r['clause_id']} | Page: {r['page']}" for r in references)
+        yield _sse("sources", {
+            "text": f"\n\nSOURCES\n{sources}",
+            "sources": [{k: v for k, v in r.items() if k != "content"} for r in references]
+        })
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/graph/{assessment_id}")
 def get_graph_data(assessment_id: int, session_id: str = Depends(get_sid)):
     assessment = store.get_assessment(session_id, assessment_id)
@@ -328,15 +735,31 @@ def get_graph_data(assessment_id: int, session_id: str = Depends(get_sid)):
             "status": r.status
         })
         
-    return {"nodes": nodes, "edges": edges}
+    # A running assessment returns the verdicts saved so far; clients poll until status is final
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "assessment": {
+            "status": assessment.status,
+            "total_clauses": assessment.total_clauses,
+            "completed": len(results)
+        }
+    }
 
 @app.get("/report/{assessment_id}")
-def generate_report(assessment_id: int, session_id: str = Depends(get_sid)):
+async def generate_report(assessment_id: int, session_id: str = Depends(get_sid)):
     assessment = store.get_assessment(session_id, assessment_id)
     if not assessment:
         raise HTTPException(status_code=404, detail="Assessment not found")
     
-    results = store.get_results_by_assessment(session_id, assessment_id)
+    # ReportLab layout is CPU-bound; render on the bounded render pool
+    buffer = await run_blocking(render_pool, _render_report, assessment, session_id)
+    return StreamingResponse(buffer, media_type="application/pdf", headers={
+        "Content-Disposition": f"attachment; filename=compliance_report_{assessment_id}.pdf"
+    })
+
+def _render_report(assessment: Assessment, session_id: str) -> io.BytesIO:
+    results = store.get_results_by_assessment(session_id, assessment.id)
     
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
@@ -383,9 +806,7 @@ def generate_report(assessment_id: int, session_id: str = Depends(get_sid)):
     doc.build(elements)
     
     buffer.seek(0)
-    return StreamingResponse(buffer, media_type="application/pdf", headers={
-        "Content-Disposition": f"attachment; filename=compliance_report_{assessment_id}.pdf"
-    })
+    return buffer
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,9 +1,14 @@
 """
 In-memory data store for temporary document storage.
-Data is cleared when the server restarts.
+Data is cleared when the server restarts, unless STORE_BACKEND=sqlite selects
+the durable SQLStore (see sql_store.py), which implements the same interface.
 """
-from datetime import datetime
-from typing import Dict, List, Optional
+import os
+import sys
+import threading
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 
 
@@ -14,10 +19,14 @@ class Document:
     file_type: str  # 'regulation' or 'customer'
     version: str
     uploaded_at: datetime = field(default_factory=datetime.utcnow)
+    # Vector namespace the clauses were ingested into; None for the session's own namespace
+    namespace: Optional[str] = None
 
 
 @dataclass
 class Clause:
+    # Slotted: sessions hold many thousands of clauses, a per-instance __dict__ adds up
+    __slots__ = ("id", "document_id", "clause_id", "text", "page_number", "severity")
     id: int
     document_id: int
     clause_id: str  # e.g., "A.5.1"
@@ -32,10 +41,18 @@ class Assessment:
     customer_doc_id: int
     regulation_doc_id: int
     created_at: datetime = field(default_factory=datetime.utcnow)
+    status: str = "complete"  # "running" while /assess is still producing results, "failed" if it aborted
+    total_clauses: int = 0
+    # Settings the verdicts were produced with; incremental runs only reuse an assessment whose settings match
+    threshold: Optional[float] = None
+    context_k: Optional[int] = None
+    use_kb: Optional[bool] = None
 
 
 @dataclass
 class AssessmentResult:
+    __slots__ = ("id", "assessment_id", "customer_clause_id", "regulation_clause_id",
+                 "status", "risk", "reasoning", "evidence_text", "confidence")
     id: int
     assessment_id: int
     customer_clause_id: int
@@ -53,6 +70,14 @@ class SessionData:
     clauses: Dict[int, Clause] = field(default_factory=dict)
     assessments: Dict[int, Assessment] = field(default_factory=dict)
     assessment_results: Dict[int, AssessmentResult] = field(default_factory=dict)
+    # Ingest-time embeddings keyed by Clause.id, reused as query vectors during assessment.
+    # Stored as float32 arrays (4 bytes per dimension instead of a boxed Python float)
+    clause_vectors: Dict[int, array] = field(default_factory=dict)
+    # Secondary indexes, maintained on insert/delete so lookups never scan the session
+    clauses_by_doc: Dict[int, List[int]] = field(default_factory=dict)
+    clause_by_doc_key: Dict[Tuple[int, str], int] = field(default_factory=dict)
+    results_by_assessment: Dict[int, List[int]] = field(default_factory=dict)
+    assessments_by_doc: Dict[int, List[int]] = field(default_factory=dict)
     doc_counter: int = 0
     clause_counter: int = 0
     assessment_counter: int = 0
@@ -64,42 +89,69 @@ class InMemoryStore:
     
     def __init__(self):
         self.sessions: Dict[str, SessionData] = {}
+        # Uploads are parsed on worker threads; guards session creation and id counters
+        self._lock = threading.RLock()
     
     def get_session(self, session_id: str) -> SessionData:
-        if session_id not in self.sessions:
-            print(f"DEBUG: Initializing new session: {session_id}")
-            self.sessions[session_id] = SessionData()
-        session = self.sessions[session_id]
+        with self._lock:
+            if session_id not in self.sessions:
+                print(f"DEBUG: Initializing new session: {session_id}")
+                self.sessions[session_id] = SessionData()
+            session = self.sessions[session_id]
         session.last_activity = datetime.utcnow()
         return session
 
     def reset(self, session_id: str = None):
         """Clear data for a specific session or all sessions."""
-        if session_id:
-            if session_id in self.sessions:
-                print(f"DEBUG: Resetting session {session_id}")
-                del self.sessions[session_id]
-        else:
-            print("DEBUG: Resetting all sessions")
-            self.sessions = {}
+        with self._lock:
+            if session_id:
+                if session_id in self.sessions:
+                    print(f"DEBUG: Resetting session {session_id}")
+                    del self.sessions[session_id]
+            else:
+                print("DEBUG: Resetting all sessions")
+                self.sessions = {}
     
     def update_activity(self, session_id: str):
         """Refresh last activity timestamp for a session."""
         if session_id in self.sessions:
             self.sessions[session_id].last_activity = datetime.utcnow()
+    
+    def session_ids(self) -> List[str]:
+        with self._lock:
+            return list(self.sessions)
 
-    # Document operations
-    def add_document(self, session_id: str, filename: str, file_type: str, version: str = "1.0") -> Document:
+    def inactive_sessions(self, idle: timedelta) -> List[str]:
+        """Ids of sessions with no activity for longer than `idle`."""
+        cutoff = datetime.utcnow() - idle
+        return [sid for sid, s in list(self.sessions.items()) if s.last_activity < cutoff]
+
+    def reset_idle_timers(self):
+        """Mark every session as active now."""
+        now = datetime.utcnow()
+        with self._lock:
+            for s in self.sessions.values():
+                s.last_activity = now
+    
+    def session_counts(self, session_id: str) -> Dict[str, int]:
         s = self.get_session(session_id)
-        s.doc_counter += 1
-        doc = Document(
-            id=s.doc_counter,
-            filename=filename,
-            file_type=file_type,
-            version=version
-        )
-        s.documents[doc.id] = doc
-        return doc
+        return {"documents": len(s.documents), "clauses": len(s.clauses)}
+
+    # Document operations
+    def add_document(self, session_id: str, filename: str, file_type: str, version: str = "1.0",
+                     namespace: Optional[str] = None) -> Document:
+        with self._lock:
+            s = self.get_session(session_id)
+            s.doc_counter += 1
+            doc = Document(
+                id=s.doc_counter,
+                filename=filename,
+                file_type=file_type,
+                version=version,
+                namespace=namespace
+            )
+            s.documents[doc.id] = doc
+            return doc
     
     def get_document(self, session_id: str, doc_id: int) -> Optional[Document]:
         return self.get_session(session_id).documents.get(doc_id)
@@ -107,99 +159,194 @@ class InMemoryStore:
     def get_all_documents(self, session_id: str) -> List[Document]:
         return list(self.get_session(session_id).documents.values())
     
-    def delete_document(self, session_id: str, doc_id: int) -> bool:
-        s = self.get_session(session_id)
-        if doc_id not in s.documents:
+    def update_document_type(self, session_id: str, doc_id: int, file_type: str) -> bool:
+        doc = self.get_document(session_id, doc_id)
+        if not doc:
             return False
-        del s.documents[doc_id]
-        # Delete related clauses
-        clause_ids_to_delete = [c.id for c in s.clauses.values() if c.document_id == doc_id]
-        for cid in clause_ids_to_delete:
-            del s.clauses[cid]
+        doc.file_type = file_type
         return True
     
+    def delete_document(self, session_id: str, doc_id: int) -> bool:
+        with self._lock:
+            s = self.get_session(session_id)
+            if doc_id not in s.documents:
+                return False
+            del s.documents[doc_id]
+            # Delete related clauses
+            for cid in s.clauses_by_doc.pop(doc_id, []):
+                clause = s.clauses.pop(cid)
+                s.clause_by_doc_key.pop((doc_id, clause.clause_id), None)
+                s.clause_vectors.pop(cid, None)
+            return True
+    
     # Clause operations
     def add_clause(self, session_id: str, document_id: int, clause_id: str, text: str, 
                    page_number: int, severity: str) -> Clause:
+        with self._lock:
+            s = self.get_session(session_id)
+            s.clause_counter += 1
+            # Labels and severities repeat heavily; interning keeps one copy of each string.
+            # The text object itself is shared with the vector docstore, not copied.
+            clause_id = sys.intern(clause_id)
+            clause = Clause(
+                id=s.clause_counter,
+                document_id=document_id,
+                clause_id=clause_id,
+                text=text,
+                page_number=page_number,
+                severity=sys.intern(severity)
+            )
+            s.clauses[clause.id] = clause
+            s.clauses_by_doc.setdefault(document_id, []).append(clause.id)
+            # First clause with a given label wins, as the old linear scan did
+            s.clause_by_doc_key.setdefault((document_id, clause_id), clause.id)
+            return clause
+    
+    def add_clauses(self, session_id: str, document_id: int, clauses: List[Dict]) -> List[Clause]:
+        """Add a batch of parsed clauses (dicts with clause_id, text, page_number, severity)."""
+        with self._lock:
+            return [
+                self.add_clause(session_id, document_id, c['clause_id'], c['text'], c['page_number'], c['severity'])
+                for c in clauses
+            ]
+    
+    def set_clause_vector(self, session_id: str, clause_id: int, vector: List[float]):
+        self.get_session(session_id).clause_vectors[clause_id] = array("f", vector)
+    
+    def set_clause_vectors(self, session_id: str, vectors: Dict[int, List[float]]):
         s = self.get_session(session_id)
-        s.clause_counter += 1
-        clause = Clause(
-            id=s.clause_counter,
-            document_id=document_id,
-            clause_id=clause_id,
-            text=text,
-            page_number=page_number,
-            severity=severity
-        )
-        s.clauses[clause.id] = clause
-        return clause
+        for clause_id, vector in vectors.items():
+            s.clause_vectors[clause_id] = array("f", vector)
+    
+    def get_clause_vector(self, session_id: str, clause_id: int) -> Optional[List[float]]:
+        vector = self.get_session(session_id).clause_vectors.get(clause_id)
+        return vector.tolist() if vector is not None else None
     
     def get_clause(self, session_id: str, clause_id: int) -> Optional[Clause]:
         return self.get_session(session_id).clauses.get(clause_id)
     
     def get_clauses_by_document(self, session_id: str, doc_id: int) -> List[Clause]:
-        return [c for c in self.get_session(session_id).clauses.values() if c.document_id == doc_id]
+        s = self.get_session(session_id)
+        return [s.clauses[cid] for cid in s.clauses_by_doc.get(doc_id, [])]
     
     def get_clause_by_doc_and_clause_id(self, session_id: str, doc_id: int, clause_id_str: str) -> Optional[Clause]:
-        for c in self.get_session(session_id).clauses.values():
-            if c.document_id == doc_id and c.clause_id == clause_id_str:
-                return c
-        return None
+        s = self.get_session(session_id)
+        cid = s.clause_by_doc_key.get((doc_id, clause_id_str))
+        return s.clauses.get(cid) if cid is not None else None
     
     # Assessment operations
-    def add_assessment(self, session_id: str, customer_doc_id: int, regulation_doc_id: int) -> Assessment:
-        s = self.get_session(session_id)
-        s.assessment_counter += 1
-        assessment = Assessment(
-            id=s.assessment_counter,
-            customer_doc_id=customer_doc_id,
-            regulation_doc_id=regulation_doc_id
-        )
-        s.assessments[assessment.id] = assessment
-        return assessment
+    def add_assessment(self, session_id: str, customer_doc_id: int, regulation_doc_id: int,
+                       status: str = "complete", total_clauses: int = 0, threshold: Optional[float] = None,
+                       context_k: Optional[int] = None, use_kb: Optional[bool] = None) -> Assessment:
+        with self._lock:
+            s = self.get_session(session_id)
+            s.assessment_counter += 1
+            assessment = Assessment(
+                id=s.assessment_counter,
+                customer_doc_id=customer_doc_id,
+                regulation_doc_id=regulation_doc_id,
+                status=status,
+                total_clauses=total_clauses,
+                threshold=threshold,
+                context_k=context_k,
+                use_kb=use_kb
+            )
+            s.assessments[assessment.id] = assessment
+            for doc_id in {customer_doc_id, regulation_doc_id}:
+                s.assessments_by_doc.setdefault(doc_id, []).append(assessment.id)
+            return assessment
     
     def get_assessment(self, session_id: str, assessment_id: int) -> Optional[Assessment]:
         return self.get_session(session_id).assessments.get(assessment_id)
     
     def get_assessments_by_doc(self, session_id: str, doc_id: int) -> List[Assessment]:
-        return [a for a in self.get_session(session_id).assessments.values() 
-                if a.customer_doc_id == doc_id or a.regulation_doc_id == doc_id]
+        s = self.get_session(session_id)
+        return [s.assessments[aid] for aid in s.assessments_by_doc.get(doc_id, [])]
+    
+    def set_assessment_status(self, session_id: str, assessment_id: int, status: str):
+        with self._lock:
+            assessment = self.get_session(session_id).assessments.get(assessment_id)
+            if assessment:
+                assessment.status = status
     
     # Assessment result operations
     def add_result(self, session_id: str, assessment_id: int, customer_clause_id: int, 
                    regulation_clause_id: int, status: str, risk: str,
                    reasoning: str, evidence_text: str, confidence: float) -> AssessmentResult:
-        s = self.get_session(session_id)
-        s.result_counter += 1
-        result = AssessmentResult(
-            id=s.result_counter,
-            assessment_id=assessment_id,
-            customer_clause_id=customer_clause_id,
-            regulation_clause_id=regulation_clause_id,
-            status=status,
-            risk=risk,
-            reasoning=reasoning,
-            evidence_text=evidence_text,
-            confidence=confidence
-        )
-        s.assessment_results[result.id] = result
-        return result
+        with self._lock:
+            s = self.get_session(session_id)
+            s.result_counter += 1
+            result = AssessmentResult(
+                id=s.result_counter,
+                assessment_id=assessment_id,
+                customer_clause_id=customer_clause_id,
+                regulation_clause_id=regulation_clause_id,
+                status=status,
+                risk=risk,
+                reasoning=reasoning,
+                evidence_text=evidence_text,
+                confidence=confidence
+            )
+            s.assessment_results[result.id] = result
+            s.results_by_assessment.setdefault(assessment_id, []).append(result.id)
+            return result
     
     def get_results_by_assessment(self, session_id: str, assessment_id: int) -> List[AssessmentResult]:
-        return [r for r in self.get_session(session_id).assessment_results.values() if r.assessment_id == assessment_id]
+        s = self.get_session(session_id)
+        return [s.assessment_results[rid] for rid in s.results_by_assessment.get(assessment_id, [])]
     
     def delete_results_by_assessment(self, session_id: str, assessment_id: int):
+        with self._lock:
+            s = self.get_session(session_id)
+            for rid in s.results_by_assessment.pop(assessment_id, []):
+                del s.assessment_results[rid]
+    
+    def memory_report(self, session_id: str) -> Dict:
+        """Approximate bytes held by a session, broken down by record type."""
         s = self.get_session(session_id)
-        result_ids = [r.id for r in s.assessment_results.values() if r.assessment_id == assessment_id]
-        for rid in result_ids:
-            del s.assessment_results[rid]
+        clause_bytes = sum(sys.getsizeof(c) for c in s.clauses.values())
+        text_bytes = sum(sys.getsizeof(c.text) for c in s.clauses.values())
+        vector_bytes = sum(sys.getsizeof(v) for v in s.clause_vectors.values())
+        result_bytes = sum(
+            sys.getsizeof(r) + sys.getsizeof(r.reasoning) + sys.getsizeof(r.evidence_text)
+            for r in s.assessment_results.values()
+        )
+        index_bytes = sum(
+            sys.getsizeof(index) for index in
+            (s.clauses, s.clause_vectors, s.clauses_by_doc, s.clause_by_doc_key, s.results_by_assessment)
+        )
+        return {
+            "documents": len(s.documents),
+            "clauses": len(s.clauses),
+            "vectors": len(s.clause_vectors),
+            "results": len(s.assessment_results),
+            "clause_record_bytes": clause_bytes,
+            "clause_text_bytes": text_bytes,
+            "clause_vector_bytes": vector_bytes,
+            "result_bytes": result_bytes,
+            "index_bytes": index_bytes,
+            "total_bytes": clause_bytes + text_bytes + vector_bytes + result_bytes + index_bytes,
+        }
     
     def delete_assessment(self, session_id: str, assessment_id: int):
-        self.delete_results_by_assessment(session_id, assessment_id)
-        s = self.get_session(session_id)
-        if assessment_id in s.assessments:
-            del s.assessments[assessment_id]
+        with self._lock:
+            self.delete_results_by_assessment(session_id, assessment_id)
+            s = self.get_session(session_id)
+            assessment = s.assessments.pop(assessment_id, None)
+            if assessment:
+                for doc_id in {assessment.customer_doc_id, assessment.regulation_doc_id}:
+                    ids = s.assessments_by_doc.get(doc_id, [])
+                    if assessment_id in ids:
+                        ids.remove(assessment_id)
+
 
+# "memory" (default) or "sqlite"
+STORE_BACKEND = os.getenv("STORE_BACKEND", "memory").lower()
+STORE_DB_PATH = os.getenv("STORE_DB_PATH", "backend/data/store.db")
 
-# Global in-memory store instance
-store = InMemoryStore()
+# Global store instance
+if STORE_BACKEND == "sqlite":
+    from .sql_store import SQLStore
+    store = SQLStore(STORE_DB_PATH)
+else:
+    store = InMemoryStore()
@@ -0,0 +1,140 @@
+"""
+PDF page-to-clause extraction, optionally sharded across a process pool.
+
+This module imports nothing from the app, but a spawned worker also re-imports the
+parent's __main__ module (e.g. backend.bulk_ingest and everything it imports), so
+worker start-up is not cheap: the pool is created once and kept for the process.
+"""
+import os
+import re
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import List, Dict, Optional, Iterator, Tuple
+
+from pypdf import PdfReader
+
+# regex for clause-like patterns
+CLAUSE_PATTERN = r'(?m)^(\d+\.[\d\.]+|[A-Z]\.[\d\.]+|Article\s+\d+:?)\s+(.*)'
+
+# Below this many pages the fork/pickle overhead outweighs the parallel speed-up
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PARALLEL_WORKERS = int(os.getenv("PDF_PARALLEL_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def extract_page_clauses(page_text: str, page_num: int) -> List[Dict]:
+    """Split one page's text into clauses. page_num is zero-based."""
+    clauses = []
+    matches = list(re.finditer(CLAUSE_PATTERN, page_text))
+
+    if not matches:
+        # Fallback: split by double newlines on this page
+        paragraphs = page_text.split("\n\n")
+        for i, p in enumerate(paragraphs):
+            if len(p.strip()) > 20:
+                clauses.append({
+                    "clause_id": f"P-{page_num}-{i}",
+                    "text": p.strip(),
+                    "page_number": page_num + 1,
+                    "severity": "UNKNOWN"
+                })
+    else:
+        for i in range(len(matches)):
+            start = matches[i].start()
+            end = matches[i+1].start() if i + 1 < len(matches) else len(page_text)
+            clause_id = matches[i].group(1).strip()
+            text = page_text[start:end].strip()
+            clauses.append({
+                "clause_id": clause_id,
+                "text": text,
+                "page_number": page_num + 1,
+                "severity": "MUST" if "shall" in text.lower() or "must" in text.lower() else "SHOULD"
+            })
+    return clauses
+
+
+def parse_reader_pages(reader: PdfReader, start: int, end: int) -> List[Dict]:
+    clauses = []
+    for page_num in range(start, end):
+        page_text = reader.pages[page_num].extract_text()
+        if not page_text:
+            continue
+        clauses.extend(extract_page_clauses(page_text, page_num))
+    return clauses
+
+
+def parse_pdf_page_range(path: str, start: int, end: int) -> List[Dict]:
+    """Worker entry point: open the PDF at `path` and parse pages [start, end)."""
+    return parse_reader_pages(PdfReader(path), start, end)
+
+
+def parse_pdf_file(path: str) -> List[Dict]:
+    """Worker entry point for bulk ingestion: read and parse a whole PDF serially."""
+    with open(path, "rb") as f:
+        reader = PdfReader(BytesIO(f.read()))
+    return parse_reader_pages(reader, 0, len(reader.pages))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the server process is multi-threaded
+        _pool = ProcessPoolExecutor(
+            max_workers=PDF_PARALLEL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def iter_pdf_clauses(file_content: bytes) -> Iterator[Tuple[int, int, List[Dict]]]:
+    """Yield (pages_done, page_count, clauses) as pages are parsed, in page order.
+
+    Large documents are split into contiguous page ranges parsed in parallel;
+    the clauses produced are identical to the serial path. Shards read the PDF from
+    a temporary file rather than each being sent a copy of its bytes.
+    """
+    reader = PdfReader(BytesIO(file_content))
+    page_count = len(reader.pages)
+
+    if page_count < PDF_PARALLEL_MIN_PAGES or PDF_PARALLEL_WORKERS < 2:
+        for page_num in range(page_count):
+            yield page_num + 1, page_count, parse_reader_pages(reader, page_num, page_num + 1)
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(file_content)
+    shards = []
+    try:
+        shard_size = -(-page_count // PDF_PARALLEL_WORKERS)
+        pool = _get_pool()
+        for start in range(0, page_count, shard_size):
+            end = min(start + shard_size, page_count)
+            shards.append((end, pool.submit(parse_pdf_page_range, f.name, start, end)))
+        print(f"DEBUG: Parsing {page_count} PDF pages in {len(shards)} parallel shards")
+
+        # Shards are consumed in submission order, so clauses stay in page order
+        for end, future in shards:
+            yield end, page_count, future.result()
+    finally:
+        # If the caller stops early, shards not yet started are dropped; their results are unused anyway
+        for _, future in shards:
+            future.cancel()
+        os.remove(f.name)
+
+
+def parse_pdf_clauses(file_content: bytes) -> List[Dict]:
+    """Parse every page of a PDF into clauses, in page order."""
+    clauses = []
+    for _, _, page_clauses in iter_pdf_clauses(file_content):
+        clauses.extend(page_clauses)
+    return clauses
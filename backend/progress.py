@@ -0,0 +1,30 @@
+"""
+Progress record for document ingestion, polled by the frontend while uploads run.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+from dataclasses import dataclass, field, asdict
+
+
+@dataclass
+class IngestProgress:
+    upload_id: str
+    filename: str
+    status: str = "parsing"  # "queued", "parsing", "embedding", "done", "failed"
+    pages_parsed: int = 0
+    total_pages: int = 0
+    clauses_parsed: int = 0
+    clauses_embedded: int = 0
+    doc_id: Optional[int] = None
+    error: Optional[str] = None
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+
+    def update(self, **changes):
+        for key, value in changes.items():
+            setattr(self, key, value)
+        self.updated_at = datetime.utcnow()
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["updated_at"] = self.updated_at.isoformat()
+        return data
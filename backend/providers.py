@@ -0,0 +1,206 @@
+"""
+Embedding and LLM providers. Gemini by default; EMBEDDING_PROVIDER=local and
+LLM_PROVIDER=local select deterministic offline stand-ins, so the ingest, /assess
+and /chat paths can be load-tested without network access:
+
+    EMBEDDING_PROVIDER=local LLM_PROVIDER=local uvicorn backend.main:app
+    python -m backend.benchmark pipeline --clauses 500
+"""
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from .lexical import tokenize
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "google").lower()
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "google").lower()
+
+EMBEDDING_DIMENSIONALITY = 768
+# Model names are part of the embedding and verdict cache keys, so providers never share entries
+EMBEDDING_MODEL = "models/gemini-embedding-001" if EMBEDDING_PROVIDER == "google" else "local/hashing-v1"
+LLM_MODEL = "models/gemini-2.0-flash-lite" if LLM_PROVIDER == "google" else "local/scripted-v1"
+
+# Local stand-ins: simulated provider behaviour
+LOCAL_EMBEDDING_LATENCY = float(os.getenv("LOCAL_EMBEDDING_LATENCY", "0.0"))  # seconds per call
+LOCAL_LLM_LATENCY = float(os.getenv("LOCAL_LLM_LATENCY", "0.3"))  # seconds to first token (+-20%)
+LOCAL_LLM_TOKEN_LATENCY = float(os.getenv("LOCAL_LLM_TOKEN_LATENCY", "0.005"))  # seconds per output word
+LOCAL_LLM_CAPACITY = int(os.getenv("LOCAL_LLM_CAPACITY", "0"))  # concurrent calls before 429s; 0 = unlimited
+LOCAL_LLM_ERROR_RATE = float(os.getenv("LOCAL_LLM_ERROR_RATE", "0.0"))  # fraction of calls answered with 429
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words vectors: signed feature hashing of tokens and token bigrams, L2-normalised.
+
+    Clauses sharing vocabulary get high cosine similarity, which is enough to exercise retrieval.
+    """
+
+    def __init__(self, dimensionality: int = EMBEDDING_DIMENSIONALITY, latency: float = LOCAL_EMBEDDING_LATENCY):
+        self.dimensionality = dimensionality
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensionality
+        tokens = tokenize(text)
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dimensionality] += 1.0 if h >> 63 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class LocalRateLimitError(Exception):
+    status_code = 429
+
+
+def _overlap_verdict(customer: str, context: str) -> dict:
+    """Verdict from the share of the customer clause's vocabulary found in the regulation context."""
+    customer_tokens = set(tokenize(customer))
+    overlap = len(customer_tokens & set(tokenize(context))) / len(customer_tokens) if customer_tokens else 0.0
+    if overlap >= 0.6:
+        status, risk = "COMPLIANT", "LOW"
+    elif overlap >= 0.3:
+        status, risk = "PARTIAL", "MEDIUM"
+    else:
+        status, risk = "NON_COMPLIANT", "HIGH"
+    return {
+        "Status": status,
+        "Risk Level": risk,
+        "Reasoning": f"{overlap:.0%} of the clause's terms appear in the regulation context.",
+        "Literal Evidence": context[:160],
+        "Confidence score": round(0.5 + overlap / 2, 2)
+    }
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Offline chat model answering the app's own prompts.
+
+    Compliance prompts get a JSON verdict (a JSON array for batched "PAIR id=" prompts) derived
+    from term overlap; anything else gets a short answer citing [1]. Latency, concurrency capacity
+    and an injected 429 rate simulate a hosted provider.
+    """
+
+    latency: float = LOCAL_LLM_LATENCY
+    token_latency: float = LOCAL_LLM_TOKEN_LATENCY
+    capacity: int = LOCAL_LLM_CAPACITY
+    error_rate: float = LOCAL_LLM_ERROR_RATE
+    _in_flight: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        text = str(messages[-1].content)
+        if "PAIR id=" in text:
+            verdicts = []
+            for block in text.split("PAIR id=")[1:]:
+                pair_id, _, body = block.partition("\n")
+                customer, _, context = body.partition("\nRegulation Context: ")
+                verdicts.append({"id": pair_id.strip(), **_overlap_verdict(customer.replace("Customer Clause: ", "", 1), context)})
+            return json.dumps(verdicts)
+        if text.startswith("Customer Clause: "):
+            customer, _, context = text[len("Customer Clause: "):].partition("\n\nRegulation Context: ")
+            return json.dumps(_overlap_verdict(customer, context))
+        system = str(messages[0].content)
+        content = system.split("Content: ", 1)[1].split("\n", 1)[0] if "Content: " in system else "no matching clause"
+        return f"According to the retrieved documents, {content[:300]} [1]."
+
+    def _admit(self):
+        with self._lock:
+            if (self.capacity and self._in_flight >= self.capacity) or random.random() < self.error_rate:
+                raise LocalRateLimitError("429 RESOURCE_EXHAUSTED: local provider rate limit")
+            self._in_flight += 1
+
+    def _leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _first_token_delay(self) -> float:
+        return self.latency * random.uniform(0.8, 1.2)
+
+    def _result(self, text: str) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs) -> ChatResult:
+        self._admit()
+        try:
+            text = self._respond(messages)
+            time.sleep(self._first_token_delay() + self.token_latency * len(text.split()))
+            return self._result(text)
+        finally:
+            self._leave()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs) -> ChatResult:
+        self._admit()
+        try:
+            text = self._respond(messages)
+            await asyncio.sleep(self._first_token_delay() + self.token_latency * len(text.split()))
+            return self._result(text)
+        finally:
+            self._leave()
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs) -> Iterator[ChatGenerationChunk]:
+        self._admit()
+        try:
+            time.sleep(self._first_token_delay())
+            for word in self._respond(messages).split(" "):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+                time.sleep(self.token_latency)
+        finally:
+            self._leave()
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                       **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        self._admit()
+        try:
+            await asyncio.sleep(self._first_token_delay())
+            for word in self._respond(messages).split(" "):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+                await asyncio.sleep(self.token_latency)
+        finally:
+            self._leave()
+
+
+def make_embeddings() -> Embeddings:
+    if EMBEDDING_PROVIDER == "local":
+        print(f"DEBUG: Using local hashing embeddings ({EMBEDDING_DIMENSIONALITY} dims)")
+        return HashingEmbeddings()
+    if EMBEDDING_PROVIDER != "google":
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER: {EMBEDDING_PROVIDER}")
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, output_dimensionality=EMBEDDING_DIMENSIONALITY)
+
+
+def make_llm() -> BaseChatModel:
+    if LLM_PROVIDER == "local":
+        print(f"DEBUG: Using scripted local LLM (latency {LOCAL_LLM_LATENCY}s, capacity {LOCAL_LLM_CAPACITY or 'unlimited'})")
+        return ScriptedChatModel()
+    if LLM_PROVIDER != "google":
+        raise ValueError(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    # Retries happen in the scheduler, which needs to see 429s to back off
+    return ChatGoogleGenerativeAI(model=LLM_MODEL, temperature=0, max_retries=0)
@@ -1,8 +1,21 @@
 import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import threading
+from urllib.parse import quote
 from dotenv import load_dotenv
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
-from typing import List, Dict
+from contextlib import contextmanager
+from typing import AsyncIterator, List, Dict, Tuple, Optional, Set
+from .models import store
+from .cache import PersistentLRUCache, CachedEmbeddings, content_key, text_hash
+from .workers import namespace_search_pool
+from .scheduler import llm_scheduler, embedding_scheduler, ScheduledEmbeddings, estimate_tokens
+from .providers import EMBEDDING_MODEL, EMBEDDING_DIMENSIONALITY, LLM_MODEL, make_embeddings, make_llm
+from .lexical import LexicalIndex, clause_lookup_ids, fusion_key, reciprocal_rank_fusion
 
 load_dotenv()
 
@@ -14,19 +27,361 @@ if USE_PINECONE:
     from langchain_pinecone import PineconeVectorStore
     from pinecone import Pinecone
 else:
+    import faiss
     from langchain_community.vectorstores import FAISS
 
+# Set EMBEDDING_CACHE_PATH="" to keep the embedding cache in memory only
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "backend/data/embedding_cache.db")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))
+
+VERDICT_CACHE_PATH = os.getenv("VERDICT_CACHE_PATH", "backend/data/verdict_cache.db")
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "20000"))
+
+COMPLIANCE_SYSTEM_PROMPT = """You are a compliance expert. Compare the provided customer clause against the regulation context.
+            Identify if it is COMPLIANT, PARTIAL, or NON_COMPLIANT.
+            Provide:
+            1. Status
+            2. Risk Level (HIGH, MEDIUM, LOW)
+            3. Reasoning
+            4. Literal Evidence (quote from the regulation)
+            5. Confidence score (0.0 to 1.0)
+            
+            Format response as JSON with those keys."""
+COMPLIANCE_USER_PROMPT = "Customer Clause: {customer}\n\nRegulation Context: {context}"
+COMPLIANCE_BATCH_SYSTEM_PROMPT = """You are a compliance expert. For EACH numbered pair below, compare the customer clause against its regulation context.
+            Identify if it is COMPLIANT, PARTIAL, or NON_COMPLIANT.
+            For every pair provide:
+            1. id (copy the pair id exactly)
+            2. Status
+            3. Risk Level (HIGH, MEDIUM, LOW)
+            4. Reasoning
+            5. Literal Evidence (quote from the regulation)
+            6. Confidence score (0.0 to 1.0)
+            
+            Format response as a JSON array with one object per pair, using those keys."""
+# Part of every verdict cache key: editing any compliance prompt invalidates cached verdicts
+COMPLIANCE_PROMPT_VERSION = content_key(
+    COMPLIANCE_SYSTEM_PROMPT, COMPLIANCE_USER_PROMPT, COMPLIANCE_BATCH_SYSTEM_PROMPT
+)[:16]
+
+# Shared knowledge-base namespace; never evicted by session cleanup
+PERMANENT_NAMESPACE = "permanent"
+
+# FAISS mode: per-namespace, per-document indexes are saved under this directory
+# after ingestion and loaded lazily on first use. Set FAISS_INDEX_DIR="" to keep them in memory only.
+FAISS_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "backend/data/faiss")
+# Open saved indexes memory-mapped read-only, so worker processes share one copy of the pages
+FAISS_MMAP = os.getenv("FAISS_MMAP", "false").lower() == "true"
+# Session namespaces only outlive a restart usefully when the clause store does too
+FAISS_PERSIST_SESSIONS = os.getenv(
+    "FAISS_PERSIST_SESSIONS", str(os.getenv("STORE_BACKEND", "memory").lower() == "sqlite")
+).lower() == "true"
+# Merged searches fetch this many times top_k per namespace, so dropping duplicate texts still leaves top_k
+RETRIEVAL_OVERFETCH = int(os.getenv("RETRIEVAL_OVERFETCH", "2"))
+# Fuse BM25 hits with vector hits when the query text is known (reciprocal rank fusion constant RRF_K)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Expected completion size per call, charged against the LLM tokens-per-minute budget up front
+ANALYSIS_OUTPUT_TOKENS = int(os.getenv("ANALYSIS_OUTPUT_TOKENS", "200"))
+CHAT_OUTPUT_TOKENS = int(os.getenv("CHAT_OUTPUT_TOKENS", "800"))
+# Pinecone accepts at most 1000 ids per delete request
+PINECONE_DELETE_BATCH = 1000
+# How often (seconds) a loaded namespace re-checks the disk for documents saved by other workers
+FAISS_REFRESH_INTERVAL = float(os.getenv("FAISS_REFRESH_INTERVAL", "2"))
+
+
+def _faiss_similarity(distance: float) -> float:
+    """Convert a squared L2 distance between unit vectors into cosine similarity."""
+    return 1.0 - float(distance) / 2.0
+
+
+def _result_text_hash(doc) -> str:
+    # Indexes built before text hashes were stored in metadata fall back to hashing the text
+    return doc.metadata.get("text_hash") or text_hash(doc.page_content)
+
+
+def _clause_metadata(clause_id, vector_doc_id: str, doc_name: str, page_number, text: str) -> Dict:
+    """Metadata stored with a clause's vector (and its lexical index entry)."""
+    return {
+        "clause_id": sys.intern(str(clause_id)),
+        "doc_id": vector_doc_id,
+        "doc_name": doc_name,
+        "page_number": int(page_number),
+        "text_hash": text_hash(text)
+    }
+
+
+def _failed_analysis(reasoning: str) -> Dict:
+    return {
+        "status": "UNKNOWN",
+        "risk": "HIGH",
+        "reasoning": reasoning,
+        "evidence_text": "N/A",
+        "confidence": 0.0
+    }
+
+
+def _count(usage: Optional[Dict[str, int]], key: str, n: int = 1):
+    """Add to a caller's usage counters ("llm_calls", "verdict_cache_hits"), if it passed any."""
+    if usage is not None:
+        usage[key] = usage.get(key, 0) + n
+
+
+def _normalize_analysis(data: Dict) -> Dict:
+    """Map the LLM's JSON keys (which vary between responses) onto our result fields."""
+    normalized = {}
+    for k, v in data.items():
+        key = str(k).lower().replace(" ", "_")
+        normalized[key] = v
+        
+    return {
+        "status": normalized.get("status", normalized.get("compliance_status", "UNKNOWN")),
+        "risk": normalized.get("risk", normalized.get("risk_level", "HIGH")),
+        "reasoning": normalized.get("reasoning", normalized.get("description", "No reasoning provided")),
+        "evidence_text": normalized.get("evidence_text", normalized.get("literal_evidence", normalized.get("evidence", "N/A"))),
+        "confidence": normalized.get("confidence", normalized.get("confidence_score", 0.0))
+    }
+
+
+class _ReadWriteLock:
+    """Many readers or one writer. Waiting writers hold off new readers, so adds are not starved by searches."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class FaissNamespace:
+    """FAISS sub-indexes for one namespace, one per document, so doc-scoped
+    searches run against that document's vectors only.
+
+    With a path, each document's index is saved to {path}/{doc_id}/ and the
+    directory is re-scanned periodically, so indexes written by other worker
+    processes are picked up and ones they deleted are dropped.
+    """
+
+    def __init__(self, embeddings, path: Optional[str] = None, mmap: bool = False, on_load=None, on_drop=None):
+        self.embeddings = embeddings
+        self.path = path
+        self.mmap = mmap
+        # Called with (doc_id, index) after a document is loaded from disk, and (doc_id) when one is dropped
+        self.on_load = on_load
+        self.on_drop = on_drop
+        self.doc_indexes: Dict[str, "FAISS"] = {}
+        # Added to since the last save; never replaced from disk
+        self._dirty: Set[str] = set()
+        # Opened read-only; reloaded writable before anything is added
+        self._mmapped: Set[str] = set()
+        # Modification time of each loaded index file, to notice newer saves
+        self._mtimes: Dict[str, float] = {}
+        # Text hashes already indexed per document, built on first add after a load
+        self._hashes: Dict[str, Set[str]] = {}
+        self._refreshed_at = 0.0
+        # FAISS CPU search is safe for concurrent readers, but not alongside an add, load or drop
+        self._lock = _ReadWriteLock()
+
+    @property
+    def size(self) -> int:
+        return sum(index.index.ntotal for index in self.doc_indexes.values())
+
+    def _doc_path(self, doc_id: str) -> str:
+        return os.path.join(self.path, doc_id)
+
+    def _load_doc(self, doc_id: str, mmap: bool):
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = FAISS.load_local(
+            self._doc_path(doc_id), self.embeddings, allow_dangerous_deserialization=True,
+            io_flags=flags, normalize_L2=True
+        )
+        self.doc_indexes[doc_id] = index
+        self._hashes.pop(doc_id, None)
+        self._mtimes[doc_id] = os.path.getmtime(os.path.join(self._doc_path(doc_id), "index.faiss"))
+        if mmap:
+            self._mmapped.add(doc_id)
+        else:
+            self._mmapped.discard(doc_id)
+        if self.on_load:
+            self.on_load(doc_id, index)
+        return index
+
+    def refresh(self, force: bool = False):
+        """Sync the loaded documents with what is saved on disk."""
+        if not self.path or (not force and time.monotonic() - self._refreshed_at < FAISS_REFRESH_INTERVAL):
+            return
+        self._refreshed_at = time.monotonic()
+        on_disk = {}
+        if os.path.isdir(self.path):
+            for doc_id in os.listdir(self.path):
+                index_file = os.path.join(self.path, doc_id, "index.faiss")
+                if os.path.exists(index_file):
+                    on_disk[doc_id] = os.path.getmtime(index_file)
+
+        with self._lock.write():
+            for doc_id in list(self.doc_indexes):
+                if doc_id not in on_disk and doc_id not in self._dirty:
+                    self.doc_indexes.pop(doc_id)
+                    self._hashes.pop(doc_id, None)
+                    self._mtimes.pop(doc_id, None)
+                    self._mmapped.discard(doc_id)
+                    if self.on_drop:
+                        self.on_drop(doc_id)
+            for doc_id, mtime in on_disk.items():
+                if doc_id not in self._dirty and self._mtimes.get(doc_id) != mtime:
+                    try:
+                        self._load_doc(doc_id, self.mmap)
+                    except Exception as e:
+                        # Possibly caught mid-save by another worker; retried on the next refresh
+                        print(f"DEBUG: Could not load FAISS index {self._doc_path(doc_id)}: {e}")
+
+    def _doc_hashes(self, doc_id: str) -> Set[str]:
+        hashes = self._hashes.get(doc_id)
+        if hashes is None:
+            index = self.doc_indexes.get(doc_id)
+            docs = index.docstore._dict.values() if index is not None else []
+            hashes = self._hashes[doc_id] = {_result_text_hash(doc) for doc in docs}
+        return hashes
+
+    def add(self, texts: List[str], vectors: List[List[float]], metadatas: List[Dict]) -> int:
+        """Add vectors, skipping texts the same document already has. Returns the number added."""
+        grouped: Dict[str, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            grouped.setdefault(meta["doc_id"], []).append(i)
+
+        added = 0
+        for doc_id, positions in grouped.items():
+            with self._lock.write():
+                hashes = self._doc_hashes(doc_id)
+                unique = []
+                for i in positions:
+                    fingerprint = metadatas[i].get("text_hash") or text_hash(texts[i])
+                    if fingerprint not in hashes:
+                        hashes.add(fingerprint)
+                        unique.append(i)
+                if not unique:
+                    continue
+                pairs = [(texts[i], vectors[i]) for i in unique]
+                metas = [metadatas[i] for i in unique]
+                added += len(unique)
+
+                index = self.doc_indexes.get(doc_id)
+                if index is not None and doc_id in self._mmapped:
+                    index = self._load_doc(doc_id, mmap=False)
+                if index is None:
+                    # Vectors are L2-normalised so scores are comparable across sub-indexes
+                    self.doc_indexes[doc_id] = FAISS.from_embeddings(pairs, self.embeddings, metadatas=metas, normalize_L2=True)
+                else:
+                    index.add_embeddings(pairs, metadatas=metas)
+                self._dirty.add(doc_id)
+        return added
+
+    def save(self):
+        """Write every document index changed since the last save."""
+        if not self.path:
+            return
+        with self._lock.write():
+            for doc_id in list(self._dirty):
+                doc_path = self._doc_path(doc_id)
+                staging = f"{doc_path}.saving-{os.getpid()}"
+                self.doc_indexes[doc_id].save_local(staging)
+                os.makedirs(doc_path, exist_ok=True)
+                # Docstore first: a new index.faiss mtime is what tells readers to reload the pair
+                os.replace(os.path.join(staging, "index.pkl"), os.path.join(doc_path, "index.pkl"))
+                os.replace(os.path.join(staging, "index.faiss"), os.path.join(doc_path, "index.faiss"))
+                os.rmdir(staging)
+                self._mtimes[doc_id] = os.path.getmtime(os.path.join(doc_path, "index.faiss"))
+                self._dirty.discard(doc_id)
+
+    def search(self, query_vector: List[float], k: int, doc_id: str = None) -> List[Tuple]:
+        results = []
+        # Shared lock: searches from concurrent retrievals run in parallel, only adds and drops wait
+        with self._lock.read():
+            if doc_id:
+                index = self.doc_indexes.get(doc_id)
+                indexes = [index] if index is not None else []
+            else:
+                indexes = list(self.doc_indexes.values())
+            for index in indexes:
+                hits = index.similarity_search_with_score_by_vector(query_vector, k=k)
+                results.extend((doc, _faiss_similarity(score)) for doc, score in hits)
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results[:k]
+
+    def drop_document(self, doc_id: str) -> bool:
+        with self._lock.write():
+            self._dirty.discard(doc_id)
+            self._hashes.pop(doc_id, None)
+            self._mmapped.discard(doc_id)
+            self._mtimes.pop(doc_id, None)
+            if self.path:
+                shutil.rmtree(self._doc_path(doc_id), ignore_errors=True)
+            if self.on_drop:
+                self.on_drop(doc_id)
+            return self.doc_indexes.pop(doc_id, None) is not None
+
+    def delete_files(self):
+        if self.path:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
 class RAGEngine:
     def __init__(self):
         # Using Gemini-2.0-flash-lite for enhanced performance and efficiency
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/gemini-embedding-001",
-            output_dimensionality=768
+        # Identical clause text is only ever embedded once, across sessions and restarts
+        self.embedding_cache = PersistentLRUCache(
+            "embeddings", db_path=EMBEDDING_CACHE_PATH or None, max_entries=EMBEDDING_CACHE_SIZE
+        )
+        # Cache misses wait for an embedding scheduler slot; the LLM goes through llm_scheduler.
+        # Gemini unless EMBEDDING_PROVIDER / LLM_PROVIDER select the local stand-ins (see providers.py)
+        self.embeddings = CachedEmbeddings(
+            ScheduledEmbeddings(make_embeddings(), embedding_scheduler),
+            model=EMBEDDING_MODEL,
+            dimensionality=EMBEDDING_DIMENSIONALITY,
+            cache=self.embedding_cache
+        )
+        self.llm = make_llm()
+        # Memoized verdicts so re-assessing unchanged clause pairs costs no LLM call
+        self.verdict_cache = PersistentLRUCache(
+            "verdicts", db_path=VERDICT_CACHE_PATH or None, max_entries=VERDICT_CACHE_SIZE
         )
-        self.llm = ChatGoogleGenerativeAI(model="models/gemini-2.0-flash-lite", temperature=0)
         self.use_pinecone = USE_PINECONE
         self.index_name = os.getenv("PINECONE_INDEX_NAME", "compliance-rag")
         self.vector_store = None
+        # FAISS mode: one registry entry per namespace so sessions never share (or wipe) each other's vectors
+        self.faiss_indexes: Dict[str, FaissNamespace] = {}
+        self._faiss_lock = threading.Lock()
+        # BM25 over the same clauses, per namespace (both backends)
+        self.lexical_indexes: Dict[str, LexicalIndex] = {}
         
         if self.use_pinecone:
             try:
@@ -39,38 +394,245 @@ class RAGEngine:
                 self.use_pinecone = False
                 self.vector_store = None
         else:
-            print("DEBUG: Using in-memory FAISS (Pinecone not configured)")
+            print(f"DEBUG: Using FAISS (Pinecone not configured), index dir: {FAISS_INDEX_DIR or 'memory only'}")
             self.vector_store = None
 
+        if not self.use_pinecone:
+            kb_path = os.getenv("FAISS_KB_PATH", "")
+            # An already-imported KB is opened lazily from FAISS_INDEX_DIR instead
+            if kb_path and os.path.isdir(kb_path) and self._namespace_path(PERMANENT_NAMESPACE) is None:
+                self.load_permanent_index(kb_path)
+
     def get_session_namespace(self, session_id: str) -> str:
         """Helper to generate session-specific namespace."""
         return f"session_{session_id}"
 
-    def ingest_documents(self, clauses: List[Dict], session_id: str = None, namespace: str = None):
-        """Ingest documents into vector store."""
-        if not clauses:
+    def _resolve_namespace(self, session_id: str = None, namespace: str = None) -> str:
+        if namespace:
+            return namespace
+        return self.get_session_namespace(session_id) if session_id else "session"
+
+    @staticmethod
+    def _is_session_namespace(namespace: str) -> bool:
+        return namespace == "session" or namespace.startswith("session_")
+
+    def _persists(self, namespace: str) -> bool:
+        if not FAISS_INDEX_DIR:
+            return False
+        return FAISS_PERSIST_SESSIONS or not self._is_session_namespace(namespace)
+
+    def vector_doc_id(self, doc_id: int, session_id: str = None, namespace: str = None) -> Optional[str]:
+        """Id the store document `doc_id` has in the namespace's vectors (grouping, filters and deletes).
+
+        Session namespaces use the store's doc id. Shared namespaces collect documents from many
+        sessions and outlive the store's per-session counters, so there the id also hashes the
+        session and upload time: stable for the stored document, never reused by a later one.
+        None if a shared namespace's document is not in the store.
+        """
+        namespace = self._resolve_namespace(session_id, namespace)
+        if self._is_session_namespace(namespace):
+            return str(doc_id)
+        doc = store.get_document(session_id, int(doc_id))
+        if doc is None:
+            return None
+        return f"{doc_id}-{content_key(session_id, doc_id, doc.uploaded_at.isoformat())[:16]}"
+
+    def _document_namespace(self, doc_id: int, session_id: str = None) -> str:
+        """Namespace the store document's clauses were ingested into."""
+        doc = store.get_document(session_id, int(doc_id)) if session_id else None
+        return self._resolve_namespace(session_id, doc.namespace if doc else None)
+
+    def _namespace_dir(self, namespace: str) -> str:
+        # Namespaces come from request input; quoting keeps each one a single, safe directory name
+        return os.path.join(FAISS_INDEX_DIR, "ns_" + quote(namespace, safe=""))
+
+    def _namespace_path(self, namespace: str) -> Optional[str]:
+        """Directory holding a namespace's saved indexes, if it has been saved."""
+        if not self._persists(namespace):
             return None
+        path = self._namespace_dir(namespace)
+        return path if os.path.isdir(path) else None
+
+    def _get_namespace(self, namespace: str, create: bool = False) -> Optional[FaissNamespace]:
+        """The namespace's indexes, loading them from disk on first use."""
+        with self._faiss_lock:
+            ns = self.faiss_indexes.get(namespace)
+        if ns is not None:
+            ns.refresh()
+            return ns
+        with self._faiss_lock:
+            if namespace in self.faiss_indexes:
+                return self.faiss_indexes[namespace]
+            path = self._namespace_path(namespace)
+            if path is None and not create:
+                return None
+            if path is None and self._persists(namespace):
+                path = self._namespace_dir(namespace)
+            ns = self._new_faiss_namespace(namespace, path)
+            self.faiss_indexes[namespace] = ns
+        if ns.path:
+            ns.refresh(force=True)
+            if ns.size:
+                print(f"DEBUG: Loaded FAISS namespace {namespace} from disk ({ns.size} vectors, mmap={ns.mmap})")
+        return ns
+
+    def _new_faiss_namespace(self, namespace: str, path: Optional[str]) -> FaissNamespace:
+        def on_load(doc_id, index):
+            # Documents saved by another process (or before a restart) get their BM25 entries here
+            docs = list(index.docstore._dict.values())
+            lexical = self._lexical(namespace, create=True)
+            lexical.drop_document(doc_id)
+            lexical.add([d.page_content for d in docs], [d.metadata for d in docs])
+
+        def on_drop(doc_id):
+            lexical = self._lexical(namespace)
+            if lexical is not None:
+                lexical.drop_document(doc_id)
+
+        return FaissNamespace(self.embeddings, path=path, mmap=FAISS_MMAP, on_load=on_load, on_drop=on_drop)
+
+    def _lexical(self, namespace: str, create: bool = False) -> Optional[LexicalIndex]:
+        lexical = self.lexical_indexes.get(namespace)
+        if lexical is None and create:
+            lexical = self.lexical_indexes.setdefault(namespace, LexicalIndex())
+        return lexical
+
+    def persist_index(self, session_id: str = None, namespace: str = None):
+        """Save the namespace's changed document indexes to FAISS_INDEX_DIR (FAISS mode only)."""
+        if self.use_pinecone:
+            return
+        namespace = self._resolve_namespace(session_id, namespace)
+        ns = self.faiss_indexes.get(namespace)
+        if ns is None or not ns.path:
+            return
+        try:
+            ns.save()
+        except Exception as e:
+            # The in-memory index is still complete; only durability is lost
+            print(f"DEBUG: Could not save FAISS namespace {namespace}: {e}")
+
+    def load_permanent_index(self, folder_path: str):
+        """Load a saved FAISS index from disk as the shared permanent knowledge base."""
+        saved = FAISS.load_local(folder_path, self.embeddings, allow_dangerous_deserialization=True)
+
+        # Re-split the saved index into per-document sub-indexes
+        texts, vectors, metadatas = [], [], []
+        for position, docstore_id in saved.index_to_docstore_id.items():
+            doc = saved.docstore.search(docstore_id)
+            texts.append(doc.page_content)
+            vectors.append(saved.index.reconstruct(position).tolist())
+            metadatas.append(doc.metadata)
+
+        path = self._namespace_dir(PERMANENT_NAMESPACE) if self._persists(PERMANENT_NAMESPACE) else None
+        kb = self._new_faiss_namespace(PERMANENT_NAMESPACE, path)
+        if texts:
+            kb.add(texts, vectors, metadatas)
+            self._lexical(PERMANENT_NAMESPACE, create=True).add(texts, metadatas)
+        with self._faiss_lock:
+            self.faiss_indexes[PERMANENT_NAMESPACE] = kb
+        self.persist_index(namespace=PERMANENT_NAMESPACE)
+        print(f"DEBUG: Loaded permanent KB index from {folder_path} ({kb.size} vectors, {len(kb.doc_indexes)} documents)")
+        return kb
+
+    def rebuild_lexical_indexes(self):
+        """Re-index the store's clauses for BM25 after a restart (Pinecone mode only).
+
+        FAISS namespaces rebuild theirs as documents load; Pinecone keeps the vectors remotely, so
+        without this hybrid search would run vector-only for everything ingested before startup.
+        """
+        if not self.use_pinecone:
+            return
+        indexed = 0
+        for session_id in store.session_ids():
+            for doc in store.get_all_documents(session_id):
+                namespace = self._resolve_namespace(session_id, doc.namespace)
+                vector_doc_id = self.vector_doc_id(doc.id, session_id=session_id, namespace=namespace)
+                clauses = store.get_clauses_by_document(session_id, doc.id)
+                if not clauses:
+                    continue
+                self._lexical(namespace, create=True).add(
+                    [c.text for c in clauses],
+                    [_clause_metadata(c.clause_id, sys.intern(vector_doc_id), doc.filename, c.page_number, c.text)
+                     for c in clauses]
+                )
+                indexed += len(clauses)
+        print(f"DEBUG: Rebuilt lexical indexes from the store: {indexed} clauses in {len(self.lexical_indexes)} namespaces")
+
+    def has_index(self, session_id: str = None, namespace: str = None) -> bool:
+        if self.use_pinecone:
+            return self.vector_store is not None
+        return self._get_namespace(self._resolve_namespace(session_id, namespace)) is not None
+
+    def memory_report(self, session_id: str = None, namespace: str = None) -> Dict:
+        """Approximate memory held by a namespace's FAISS vectors (FAISS mode only)."""
+        ns = None if self.use_pinecone else self._get_namespace(self._resolve_namespace(session_id, namespace))
+        if ns is None:
+            return {"vectors": 0, "vector_bytes": 0, "documents": 0}
+        # Memory-mapped indexes live in the shared page cache rather than this process's heap
+        vector_bytes = sum(
+            index.index.ntotal * index.index.d * 4
+            for doc_id, index in ns.doc_indexes.items() if doc_id not in ns._mmapped
+        )
+        return {
+            "vectors": ns.size, "vector_bytes": vector_bytes, "documents": len(ns.doc_indexes),
+            "mmapped_documents": len(ns._mmapped)
+        }
+
+    def index_size(self, session_id: str = None, namespace: str = None) -> int:
+        """Number of vectors held for a namespace (FAISS mode only, -1 when unknown)."""
+        if self.use_pinecone:
+            return -1
+        ns = self._get_namespace(self._resolve_namespace(session_id, namespace))
+        return ns.size if ns is not None else 0
+
+    def ingest_documents(self, clauses: List[Dict], session_id: str = None, namespace: str = None) -> List[List[float]]:
+        """Ingest documents into vector store.
+
+        Returns the clause embeddings (aligned with ``clauses``) so callers can
+        reuse them as query vectors instead of embedding the same text again.
+        """
+        if not clauses:
+            return []
+        
+        try:
+            vectors = self.embeddings.embed_documents([c['text'] for c in clauses])
+        except Exception as e:
+            print(f"DEBUG: Vector Store Ingestion Error: {e}")
+            raise e
+        self.upsert_vectors(clauses, vectors, session_id=session_id, namespace=namespace)
+        return vectors
+
+    def upsert_vectors(self, clauses: List[Dict], vectors: List[List[float]], session_id: str = None,
+                       namespace: str = None, batch_size: int = 64):
+        """Add already-embedded clauses (aligned with ``vectors``) to the namespace.
+
+        Each clause's doc_id is its store document id; it is stored as that document's vector_doc_id.
+        """
+        if not clauses:
+            return
             
-        # Determine namespace
-        if not namespace:
-            namespace = self.get_session_namespace(session_id) if session_id else "session"
+        namespace = self._resolve_namespace(session_id, namespace)
+        vector_doc_ids = {}
+        for c in clauses:
+            if c['doc_id'] not in vector_doc_ids:
+                vector_doc_id = self.vector_doc_id(c['doc_id'], session_id=session_id, namespace=namespace)
+                if vector_doc_id is None:
+                    raise ValueError(f"Document {c['doc_id']} must be in the store before it is added to {namespace}")
+                vector_doc_ids[c['doc_id']] = sys.intern(vector_doc_id)
             
+        # The text objects are passed through unchanged, so the FAISS docstore shares them with the clause store
         texts = [c['text'] for c in clauses]
         metadatas = [
-            {
-                "clause_id": str(c['clause_id']), 
-                "doc_id": str(c['doc_id']),
-                "doc_name": c.get('doc_name', 'Unknown'),
-                "page_number": int(c.get('page_number', 1))
-            } 
+            _clause_metadata(c['clause_id'], vector_doc_ids[c['doc_id']], c.get('doc_name', 'Unknown'),
+                             c.get('page_number', 1), c['text'])
             for c in clauses
         ]
         
         try:
             if self.use_pinecone:
                 try:
-                    # Specific namespace for ingestion
-                    self.vector_store.add_texts(texts, metadatas=metadatas, namespace=namespace)
+                    # Upsert the precomputed vectors directly into the target namespace
+                    self._pinecone_upsert(texts, vectors, metadatas, namespace, batch_size=batch_size)
                     print(f"DEBUG: Ingested {len(texts)} texts into namespace: {namespace}")
                 except Exception as e:
                     if "dimension" in str(e).lower():
@@ -78,21 +640,29 @@ class RAGEngine:
                         raise Exception("Pinecone Dimension Mismatch: Please recreate your Pinecone index with 768 dimensions for Gemini.")
                     raise e
             else:
-                # FAISS mode (no namespaces in basic FAISS wrapper)
-                if self.vector_store is None:
-                    self.vector_store = FAISS.from_texts(texts, self.embeddings, metadatas=metadatas)
-                else:
-                    self.vector_store.add_texts(texts, metadatas=metadatas)
+                added = self._get_namespace(namespace, create=True).add(texts, vectors, metadatas)
+                print(f"DEBUG: Ingested {added} texts into FAISS namespace: {namespace} ({len(texts) - added} duplicates skipped)")
         except Exception as e:
             print(f"DEBUG: Vector Store Ingestion Error: {e}")
             raise e
-        
-        return self.vector_store
+        self._lexical(namespace, create=True).add(texts, metadatas)
+
+    def _pinecone_upsert(self, texts: List[str], vectors: List[List[float]], metadatas: List[Dict],
+                         namespace: str, batch_size: int = 64):
+        # Same record layout as PineconeVectorStore.add_texts (text stored under the "text" key).
+        # Ids are derived from (doc, text), so a repeated clause overwrites its earlier copy instead of duplicating it
+        records = list({
+            f"{meta['doc_id']}-{meta['text_hash']}": {
+                "id": f"{meta['doc_id']}-{meta['text_hash']}", "values": vector, "metadata": {**meta, "text": text}
+            }
+            for text, vector, meta in zip(texts, vectors, metadatas)
+        }.values())
+        for i in range(0, len(records), batch_size):
+            self.vector_store.index.upsert(vectors=records[i:i + batch_size], namespace=namespace)
 
     def clear_index(self, session_id: str = None, namespace: str = None):
         """Clear a specific namespace in the vector index."""
-        if not namespace:
-            namespace = self.get_session_namespace(session_id) if session_id else "session"
+        namespace = self._resolve_namespace(session_id, namespace)
             
         if self.use_pinecone:
             try:
@@ -102,84 +672,239 @@ class RAGEngine:
                 # Note: deleting with delete_all=True only works if we don't specify namespace? 
                 # Actually index.delete(delete_all=True, namespace=namespace) is correct for Pinecone.
                 index.delete(delete_all=True, namespace=namespace)
+                self.lexical_indexes.pop(namespace, None)
                 print(f"DEBUG: Cleared Pinecone namespace: {namespace}")
             except Exception as e:
                 print(f"DEBUG: Pinecone Clear Index Error (Namespace: {namespace}): {e}")
         else:
-            self.vector_store = None
+            # Only this namespace's index is dropped; other sessions and the KB are untouched
+            with self._faiss_lock:
+                ns = self.faiss_indexes.pop(namespace, None)
+                self.lexical_indexes.pop(namespace, None)
+            if ns is not None:
+                ns.delete_files()
+            elif self._namespace_path(namespace):
+                shutil.rmtree(self._namespace_path(namespace), ignore_errors=True)
+            print(f"DEBUG: Cleared FAISS namespace: {namespace}")
+
+    def delete_document_vectors(self, doc_id: int, session_id: str = None, namespace: str = None):
+        """Drop the vectors of a single store document from a namespace. Call before deleting it from the store.
+
+        Raises if the vector store could not delete them, so callers can keep the document for a retry.
+        """
+        namespace = self._resolve_namespace(session_id, namespace)
+        vector_doc_id = self.vector_doc_id(doc_id, session_id=session_id, namespace=namespace)
+        if vector_doc_id is None:
+            return
+
+        if self.use_pinecone:
+            # Serverless indexes can't delete by metadata filter; record ids are "{doc_id}-{text_hash}" (see _pinecone_upsert)
+            try:
+                for ids in self.vector_store.index.list(prefix=f"{vector_doc_id}-", namespace=namespace):
+                    for i in range(0, len(ids), PINECONE_DELETE_BATCH):
+                        self.vector_store.index.delete(ids=ids[i:i + PINECONE_DELETE_BATCH], namespace=namespace)
+            except Exception as e:
+                print(f"DEBUG: Pinecone Delete Error (Namespace: {namespace}, Doc: {vector_doc_id}): {e}")
+                raise
+            lexical = self._lexical(namespace)
+            if lexical is not None:
+                lexical.drop_document(vector_doc_id)
+        else:
+            ns = self._get_namespace(namespace)
+            if ns is not None:
+                ns.drop_document(vector_doc_id)
 
-    def retrieve_similar_clauses(self, query_text: str, top_k: int = 5, doc_id: int = None, use_kb: bool = False, session_id: str = None):
-        if self.vector_store is None:
+    def retrieve_similar_clauses(self, query_text: str, top_k: int = 5, doc_id: int = None, use_kb: bool = False,
+                                 session_id: str = None, clause_lookup: bool = False):
+        """Hybrid search: vector hits fused with BM25 hits by reciprocal rank.
+
+        With HYBRID_RETRIEVAL on, scores are fusion scores (higher is better, not similarities).
+        With clause_lookup, a query that only names clause ids ("A.5.1", "clause 4.2") is answered
+        from the lexical index when those ids exist, without embedding the query.
+        """
+        if not self._has_search_target(use_kb, session_id, doc_id):
             return []
-            
-        session_ns = self.get_session_namespace(session_id) if session_id else "session"
-        namespaces = [session_ns]
+        if clause_lookup:
+            hits = self.lookup_clauses(query_text, doc_id=doc_id, use_kb=use_kb, session_id=session_id)
+            if hits:
+                print(f"DEBUG: Answered clause-id lookup '{query_text}' lexically ({len(hits)} hits)")
+                return hits[:top_k]
+
+        query_vector = self.embeddings.embed_query(query_text)
+        if not HYBRID_RETRIEVAL:
+            return self._vector_search(query_vector, top_k, doc_id, use_kb, session_id)
+
+        k = top_k * RETRIEVAL_OVERFETCH
+        rankings = [self._vector_search(query_vector, k, doc_id, use_kb, session_id)]
+        rankings.extend(self._lexical_rankings(query_text, k, doc_id, use_kb, session_id))
+        return reciprocal_rank_fusion(rankings, RRF_K)[:top_k]
+
+    def _lexical_rankings(self, query_text: str, k: int, doc_id: int, use_kb: bool, session_id: str) -> List[List[Tuple]]:
+        # BM25 scores are per-namespace statistics, so each namespace is its own ranking
+        rankings = []
+        for ns, vector_doc_id in self._search_targets(use_kb, session_id, doc_id):
+            lexical = self._lexical(ns)
+            if lexical is not None:
+                rankings.append(lexical.search(query_text, k, doc_id=vector_doc_id))
+        return rankings
+
+    def lookup_clauses(self, query_text: str, doc_id: int = None, use_kb: bool = False, session_id: str = None):
+        """Exact clause-id matches for a pure lookup query, as (document, 1.0) pairs; [] otherwise."""
+        clause_ids = clause_lookup_ids(query_text)
+        if not clause_ids:
+            return []
+        hits = []
+        for ns, vector_doc_id in self._search_targets(use_kb, session_id, doc_id):
+            lexical = self._lexical(ns)
+            if lexical is not None:
+                hits.extend((doc, 1.0) for doc in lexical.lookup_clause_ids(clause_ids, doc_id=vector_doc_id))
+        return hits
+
+    def _search_targets(self, use_kb: bool, session_id: str, doc_id: int = None) -> List[Tuple[str, Optional[str]]]:
+        """(namespace, vector doc id filter) pairs a search covers.
+
+        A doc-scoped search only looks where that document was ingested (the session namespace,
+        the KB or another shared namespace), filtered by its id there.
+        """
+        if doc_id:
+            namespace = self._document_namespace(doc_id, session_id)
+            vector_doc_id = self.vector_doc_id(doc_id, session_id=session_id, namespace=namespace)
+            return [(namespace, vector_doc_id)] if vector_doc_id else []
+        targets = [(self._resolve_namespace(session_id), None)]
         if use_kb:
-            namespaces.append("permanent")
-            
-        all_results = []
-        
+            targets.append((PERMANENT_NAMESPACE, None))
+        return targets
+
+    def _has_search_target(self, use_kb: bool, session_id: str, doc_id: int = None) -> bool:
+        targets = self._search_targets(use_kb, session_id, doc_id)
         if self.use_pinecone:
-            # Search across specified namespaces
-            for ns in namespaces:
-                try:
-                    results = self.vector_store.similarity_search_with_score(
-                        query_text, 
-                        k=top_k * 2, 
-                        namespace=ns
-                    )
-                    all_results.extend(results)
-                except Exception as e:
-                    print(f"DEBUG: Pinecone search error in namespace {ns}: {e}")
-            
-            # Re-sort combined results by score (descending for similarity, but score is usually distance)
-            # Pinecone score in similarity_search_with_score is usually similarity (higher is better)
-            all_results.sort(key=lambda x: x[1], reverse=True)
+            return self.vector_store is not None and bool(targets)
+        return any(self._get_namespace(ns) is not None for ns, _ in targets)
+
+    def retrieve_by_vector(self, query_vector: List[float], top_k: int = 5, doc_id: int = None, use_kb: bool = False,
+                           session_id: str = None, query_text: str = None):
+        """Top-k (document, similarity) pairs for a query that is already embedded.
+
+        Given the query's text too (and HYBRID_RETRIEVAL on), hits come in the fused vector + BM25
+        order of retrieve_similar_clauses, but keep similarity scores so thresholds still apply. A
+        BM25-only hit gets the lowest similarity among the vector hits, an upper bound of its own.
+        """
+        if not self._has_search_target(use_kb, session_id, doc_id):
+            return []
+        if not query_text or not HYBRID_RETRIEVAL:
+            return self._vector_search(query_vector, top_k, doc_id, use_kb, session_id)
+
+        k = top_k * RETRIEVAL_OVERFETCH
+        vector_hits = self._vector_search(query_vector, k, doc_id, use_kb, session_id)
+        if not vector_hits:
+            return []
+        fused = reciprocal_rank_fusion(
+            [vector_hits] + self._lexical_rankings(query_text, k, doc_id, use_kb, session_id), RRF_K
+        )
+        similarities = {fusion_key(doc): score for doc, score in vector_hits}
+        floor = vector_hits[-1][1]
+        return [(doc, similarities.get(fusion_key(doc), floor)) for doc, _ in fused[:top_k]]
+
+    def _vector_search(self, query_vector: List[float], top_k: int, doc_id: int, use_kb: bool,
+                       session_id: str) -> List[Tuple]:
+        """Top-k (document, similarity) pairs across the search targets, best first, one per clause text."""
+        if not self._has_search_target(use_kb, session_id, doc_id):
+            return []
+
+        targets = self._search_targets(use_kb, session_id, doc_id)
+        # Several namespaces (or documents) may hold the same clause text; fetch extra so duplicates can be dropped
+        k = top_k * RETRIEVAL_OVERFETCH if len(targets) > 1 or not doc_id else top_k
+
+        # The query is embedded once by the caller; each namespace is queried with the same vector,
+        # concurrently when there are several, so latency is one round-trip rather than one per namespace
+        if len(targets) == 1:
+            all_results = self._search_namespace(targets[0][0], query_vector, k, targets[0][1])
         else:
-            # FAISS search
-            all_results = self.vector_store.similarity_search_with_score(query_text, k=top_k * 2)
-        
-        if doc_id:
-            filtered_docs = [
-                (doc, score) for doc, score in all_results 
-                if doc.metadata.get('doc_id') == str(doc_id)
+            futures = [
+                namespace_search_pool.submit(self._search_namespace, ns, query_vector, k, vector_doc_id)
+                for ns, vector_doc_id in targets
             ]
-            return filtered_docs[:top_k]
-            
-        return all_results[:top_k]
+            all_results = [hit for future in futures for hit in future.result()]
+
+        # Pinecone scores and converted FAISS scores are both similarities (higher is better)
+        all_results.sort(key=lambda x: x[1], reverse=True)
+        # Keep the best-scoring copy of each clause text so duplicates don't crowd out distinct hits
+        seen = set()
+        unique_results = []
+        for doc, score in all_results:
+            fingerprint = _result_text_hash(doc)
+            if fingerprint not in seen:
+                seen.add(fingerprint)
+                unique_results.append((doc, score))
+        return unique_results[:top_k]
+
+    def _search_namespace(self, namespace: str, query_vector: List[float], k: int,
+                          vector_doc_id: str = None) -> List[Tuple]:
+        """Top-k (document, similarity) pairs from one namespace; errors yield no hits."""
+        if self.use_pinecone:
+            # Doc-scoped searches are filtered inside the index, so every hit belongs to the document
+            search_filter = {"doc_id": vector_doc_id} if vector_doc_id else None
+            try:
+                return self.vector_store.similarity_search_by_vector_with_score(
+                    query_vector, 
+                    k=k, 
+                    namespace=namespace,
+                    filter=search_filter
+                )
+            except Exception as e:
+                print(f"DEBUG: Pinecone search error in namespace {namespace}: {e}")
+                return []
+        # FAISS search: only the session index (and the KB if requested)
+        faiss_ns = self._get_namespace(namespace)
+        if faiss_ns is None:
+            return []
+        return faiss_ns.search(query_vector, k, doc_id=vector_doc_id)
+
+    def _verdict_key(self, customer_clause: str, regulation_context: str) -> str:
+        return content_key(LLM_MODEL, COMPLIANCE_PROMPT_VERSION, customer_clause, regulation_context)
+
+    def _remember_verdict(self, key: str, analysis: Dict):
+        # Failed or unparseable analyses are not cached so they get retried next time
+        if analysis.get("status") != "UNKNOWN":
+            self.verdict_cache.put(key, json.dumps(analysis).encode("utf-8"))
 
-    async def analyze_compliance(self, customer_clause: str, regulation_context: str):
+    async def analyze_compliance(self, customer_clause: str, regulation_context: str,
+                                 usage: Optional[Dict[str, int]] = None):
+        """Verdict for one clause pair. `usage`, if given, counts LLM calls and verdict cache hits."""
+        key = self._verdict_key(customer_clause, regulation_context)
+        cached = self.verdict_cache.get(key)
+        if cached is not None:
+            _count(usage, "verdict_cache_hits")
+            return json.loads(cached)
+
+        analysis = await self._analyze_single(customer_clause, regulation_context, usage)
+        self._remember_verdict(key, analysis)
+        return analysis
+
+    async def _analyze_single(self, customer_clause: str, regulation_context: str,
+                              usage: Optional[Dict[str, int]] = None) -> Dict:
         prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a compliance expert. Compare the provided customer clause against the regulation context.
-            Identify if it is COMPLIANT, PARTIAL, or NON_COMPLIANT.
-            Provide:
-            1. Status
-            2. Risk Level (HIGH, MEDIUM, LOW)
-            3. Reasoning
-            4. Literal Evidence (quote from the regulation)
-            5. Confidence score (0.0 to 1.0)
-            
-            Format response as JSON with those keys."""),
-            ("user", "Customer Clause: {customer}\n\nRegulation Context: {context}")
+            ("system", COMPLIANCE_SYSTEM_PROMPT),
+            ("user", COMPLIANCE_USER_PROMPT)
         ])
         
         chain = prompt | self.llm
+
+        async def invoke():
+            # Counted per attempt: rate-limited calls that get retried are requests too
+            _count(usage, "llm_calls")
+            return await chain.ainvoke({"customer": customer_clause, "context": regulation_context})
+
         print(f"DEBUG: Calling LLM for compliance analysis...")
         try:
-            res = await chain.ainvoke({"customer": customer_clause, "context": regulation_context})
+            res = await llm_scheduler.run(
+                invoke,
+                tokens=estimate_tokens(COMPLIANCE_SYSTEM_PROMPT, customer_clause, regulation_context) + ANALYSIS_OUTPUT_TOKENS
+            )
             print(f"DEBUG: LLM response received")
         except Exception as e:
             print(f"DEBUG: LLM Invocation Error: {e}")
-            return {
-                "status": "UNKNOWN",
-                "risk": "HIGH",
-                "reasoning": f"AI analysis failed: {str(e)}",
-                "evidence_text": "N/A",
-                "confidence": 0.0
-            }
-        
-        import json
-        import re
+            return _failed_analysis(f"AI analysis failed: {str(e)}")
         
         try:
             content = res.content.strip()
@@ -189,42 +914,111 @@ class RAGEngine:
             if start != -1 and end != -1:
                 content = content[start:end+1]
             
-            data = json.loads(content)
-            
-            normalized = {}
-            for k, v in data.items():
-                key = str(k).lower().replace(" ", "_")
-                normalized[key] = v
-                
-            final = {
-                "status": normalized.get("status", normalized.get("compliance_status", "UNKNOWN")),
-                "risk": normalized.get("risk", normalized.get("risk_level", "HIGH")),
-                "reasoning": normalized.get("reasoning", normalized.get("description", "No reasoning provided")),
-                "evidence_text": normalized.get("evidence_text", normalized.get("literal_evidence", normalized.get("evidence", "N/A"))),
-                "confidence": normalized.get("confidence", normalized.get("confidence_score", 0.0))
-            }
-            return final
+            return _normalize_analysis(json.loads(content))
         except Exception as e:
             print(f"DEBUG: CRITICAL - JSON Parse Error in rag.py: {e}")
             print(f"DEBUG: RAW content was: {res.content}")
-            return {
-                "status": "UNKNOWN",
-                "risk": "HIGH",
-                "reasoning": f"Failed to interpret AI response: {str(e)}",
-                "evidence_text": "N/A",
-                "confidence": 0.0
-            }
+            return _failed_analysis(f"Failed to interpret AI response: {str(e)}")
+
+    async def analyze_compliance_batch(self, pairs: List[Tuple[str, str, str]],
+                                       usage: Optional[Dict[str, int]] = None) -> Dict[str, Dict]:
+        """Analyze several (pair_id, customer clause, regulation context) pairs in one LLM call.
+
+        Returns analyses keyed by pair_id. Cached verdicts are served without an
+        LLM call. If the response cannot be parsed the batch is split in half and
+        retried; single pairs fall back to a one-clause prompt. `usage` is as for analyze_compliance.
+        """
+        keys = {pair_id: self._verdict_key(customer, context) for pair_id, customer, context in pairs}
+        cached = self.verdict_cache.get_many(list(keys.values()))
+
+        results = {pair_id: json.loads(cached[key]) for pair_id, key in keys.items() if key in cached}
+        _count(usage, "verdict_cache_hits", len(results))
+        pending = [p for p in pairs if p[0] not in results]
+        fresh = await self._analyze_batch(pending, usage)
+        for pair_id, analysis in fresh.items():
+            self._remember_verdict(keys[pair_id], analysis)
+        results.update(fresh)
+        return results
+
+    async def _analyze_batch(self, pairs: List[Tuple[str, str, str]],
+                             usage: Optional[Dict[str, int]] = None) -> Dict[str, Dict]:
+        if not pairs:
+            return {}
+        if len(pairs) == 1:
+            pair_id, customer, context = pairs[0]
+            return {pair_id: await self._analyze_single(customer, context, usage)}
 
-    def answer_general_question(self, query: str, context: str):
         prompt = ChatPromptTemplate.from_messages([
+            ("system", COMPLIANCE_BATCH_SYSTEM_PROMPT),
+            ("user", "{pairs}")
+        ])
+        pairs_text = "\n\n".join(
+            f"PAIR id={pair_id}\nCustomer Clause: {customer}\nRegulation Context: {context}"
+            for pair_id, customer, context in pairs
+        )
+
+        chain = prompt | self.llm
+
+        async def invoke():
+            _count(usage, "llm_calls")
+            return await chain.ainvoke({"pairs": pairs_text})
+
+        print(f"DEBUG: Calling LLM for batched compliance analysis ({len(pairs)} pairs)...")
+        try:
+            res = await llm_scheduler.run(
+                invoke,
+                tokens=estimate_tokens(COMPLIANCE_BATCH_SYSTEM_PROMPT, pairs_text) + ANALYSIS_OUTPUT_TOKENS * len(pairs)
+            )
+        except Exception as e:
+            print(f"DEBUG: LLM Invocation Error: {e}")
+            return {pair_id: _failed_analysis(f"AI analysis failed: {str(e)}") for pair_id, _, _ in pairs}
+
+        results: Dict[str, Dict] = {}
+        try:
+            content = res.content.strip()
+            start = content.find('[')
+            end = content.rfind(']')
+            if start != -1 and end != -1:
+                content = content[start:end+1]
+
+            wanted = {pair_id for pair_id, _, _ in pairs}
+            for item in json.loads(content):
+                if isinstance(item, dict) and str(item.get("id")) in wanted:
+                    results[str(item["id"])] = _normalize_analysis(item)
+        except Exception as e:
+            print(f"DEBUG: Batch JSON Parse Error ({len(pairs)} pairs), splitting and retrying: {e}")
+
+        missing = [p for p in pairs if p[0] not in results]
+        if missing:
+            if len(missing) == len(pairs):
+                half = len(missing) // 2
+                retried = await asyncio.gather(
+                    self._analyze_batch(missing[:half], usage),
+                    self._analyze_batch(missing[half:], usage)
+                )
+                for part in retried:
+                    results.update(part)
+            else:
+                # Partial answer: only the pairs the model skipped are re-asked
+                results.update(await self._analyze_batch(missing, usage))
+        return results
+
+    def _chat_prompt(self, sources_appended: bool = False) -> ChatPromptTemplate:
+        if sources_appended:
+            # Streaming: the numbered sources are appended by the server, so the model only cites
+            citation_rules = """1. Use numerical citations in your text, e.g., "The network must support 10kV [1]."
+            2. Do NOT write a SOURCES section; the list of sources is appended automatically after your answer."""
+        else:
+            citation_rules = """1. Use numerical citations in your text, e.g., "The network must support 10kV [1]."
+            2. At the very end of your response, list your sources in a "SOURCES" section.
+            3. Each source should look like: "[1] File: filename.pdf | Clause: A.1 | Page: 5"
+            4. This keeps the main response clean while providing full traceability at the bottom."""
+        return ChatPromptTemplate.from_messages([
             ("system", """You are a helpful compliance assistant with multilingual capabilities. 
             Answer the user's question accurately based ON THE PROVIDED document context.
             
             CITATION STYLE (IMPORTANT):
-            1. Use numerical citations in your text, e.g., "The network must support 10kV [1]."
-            2. At the very end of your response, list your sources in a "SOURCES" section.
-            3. Each source should look like: "[1] File: filename.pdf | Clause: A.1 | Page: 5"
-            4. This keeps the main response clean while providing full traceability at the bottom.
+            """ + citation_rules + """
             
             MULTILINGUAL RULES:
             1. If the document context is in a language other than the user's query, translate the relevant information automatically.
@@ -235,11 +1029,24 @@ class RAGEngine:
             {context}"""),
             ("user", "{query}")
         ])
-        
-        chain = prompt | self.llm
-        res = chain.invoke({"query": query, "context": context})
+
+    async def answer_general_question(self, query: str, context: str):
+        chain = self._chat_prompt() | self.llm
+        res = await llm_scheduler.run(
+            lambda: chain.ainvoke({"query": query, "context": context}),
+            tokens=estimate_tokens(query, context) + CHAT_OUTPUT_TOKENS
+        )
         return res.content
 
+    async def stream_general_question(self, query: str, context: str) -> AsyncIterator[str]:
+        """Yield the answer as the LLM generates it; the caller appends the sources."""
+        chain = self._chat_prompt(sources_appended=True) | self.llm
+        # A stream cannot be retried once tokens have gone out, so it only holds a slot
+        async with llm_scheduler.slot(tokens=estimate_tokens(query, context) + CHAT_OUTPUT_TOKENS):
+            async for chunk in chain.astream({"query": query, "context": context}):
+                if chunk.content:
+                    yield chunk.content
+
 
 # Global RAG instance
 rag_engine = RAGEngine()
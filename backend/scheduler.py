@@ -0,0 +1,307 @@
+"""
+Process-wide admission control for calls to the LLM and embedding providers.
+
+Every call waits for a slot on its provider's scheduler, which enforces a global
+concurrency limit, a per-session limit and a tokens-per-minute budget. Sessions
+are served round-robin, so one large assessment cannot starve another session's
+chat. The global limit adapts AIMD-style: it grows by ~1 per window of successful
+calls and halves when the provider answers 429. Rate-limited and transient
+server errors are retried with jittered exponential backoff.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_SESSION_CONCURRENCY = int(os.getenv("LLM_SESSION_CONCURRENCY", "8"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))  # 0 disables the budget
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "8"))
+EMBED_SESSION_CONCURRENCY = int(os.getenv("EMBED_SESSION_CONCURRENCY", "4"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "0"))
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "5"))
+RATE_LIMIT_BASE_DELAY = float(os.getenv("RATE_LIMIT_BASE_DELAY", "1.0"))
+
+# Transient server errors are retried too, but only a 429 shrinks the concurrency limit
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "resourceexhausted", "rate limit", "ratelimit", "quota")
+
+# Session the current request works for; set by the API's session dependency and by ingestion
+current_session: contextvars.ContextVar[str] = contextvars.ContextVar("current_session", default="default")
+
+T = TypeVar("T")
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return max(1, sum(len(t) for t in texts) // 4)
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_rate_limit(exc: BaseException) -> bool:
+    if _status_code(exc) == 429:
+        return True
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    return is_rate_limit(exc) or _status_code(exc) in RETRY_STATUSES
+
+
+def backoff_delay(attempt: int, base_delay: float = RATE_LIMIT_BASE_DELAY) -> float:
+    # Jitter keeps calls that were rejected together from retrying together
+    return base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+class _Waiter:
+    __slots__ = ("session_id", "tokens", "granted", "notify")
+
+    def __init__(self, session_id: str, tokens: int, notify: Callable[[], None]):
+        self.session_id = session_id
+        self.tokens = tokens
+        self.granted = False
+        self.notify = notify
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ProviderScheduler:
+    """Slots for one provider, shared by the event loop and worker threads."""
+
+    def __init__(self, name: str, max_concurrency: int, session_concurrency: int, tokens_per_minute: int,
+                 min_concurrency: int = 1, max_retries: int = RATE_LIMIT_RETRIES,
+                 base_delay: float = RATE_LIMIT_BASE_DELAY):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.session_concurrency = session_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        # AIMD window: the number of calls allowed in flight right now
+        self.limit = float(max_concurrency)
+        self._lock = threading.Lock()
+        # Sessions with waiting calls, in round-robin order
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._active: Dict[str, int] = {}
+        self._in_flight = 0
+        self._tokens = float(tokens_per_minute)
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self.counters = {"calls": 0, "rate_limited": 0, "retries": 0, "failed": 0}
+
+    # Admission (all under self._lock)
+    def _refill(self):
+        now = time.monotonic()
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + (now - self._refilled) * self.tokens_per_minute / 60)
+        self._refilled = now
+
+    def _dispatch(self) -> float:
+        """Grant waiting calls while there is capacity. Returns seconds until the token budget
+        admits the next one, or 0 if nothing is waiting on the budget."""
+        self._refill()
+        while self._in_flight < max(1, int(self.limit)) and self._queues:
+            for session_id, queue in self._queues.items():
+                if self._active.get(session_id, 0) < self.session_concurrency:
+                    break
+            else:
+                return 0.0  # every waiting session is at its own limit
+            waiter = queue[0]
+            if self.tokens_per_minute and self._tokens < waiter.tokens:
+                return (waiter.tokens - self._tokens) * 60 / self.tokens_per_minute
+            queue.popleft()
+            # Served sessions move to the back of the rotation
+            del self._queues[session_id]
+            if queue:
+                self._queues[session_id] = queue
+            self._tokens -= waiter.tokens
+            self._in_flight += 1
+            self._active[session_id] = self._active.get(session_id, 0) + 1
+            waiter.granted = True
+            waiter.notify()
+        return 0.0
+
+    def _schedule(self):
+        delay = self._dispatch()
+        if delay > 0 and self._timer is None:
+            self._timer = threading.Timer(delay, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._schedule()
+
+    def _enqueue(self, session_id: str, tokens: int, notify: Callable[[], None]) -> _Waiter:
+        # A call larger than the whole budget would never be admitted; let it drain the bucket instead
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        waiter = _Waiter(session_id, tokens, notify)
+        with self._lock:
+            self._queues.setdefault(session_id, deque()).append(waiter)
+            self._schedule()
+        return waiter
+
+    def _abandon(self, waiter: _Waiter):
+        """Withdraw a waiter whose caller gave up (cancelled); releases its slot if already granted."""
+        with self._lock:
+            if not waiter.granted:
+                queue = self._queues.get(waiter.session_id)
+                if queue is not None:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[waiter.session_id]
+                return
+        self._release(waiter.session_id, "cancelled")
+
+    def _release(self, session_id: str, outcome: str):
+        with self._lock:
+            self._in_flight -= 1
+            self._active[session_id] -= 1
+            if not self._active[session_id]:
+                del self._active[session_id]
+            if outcome == "ok":
+                self.counters["calls"] += 1
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif outcome == "rate_limited":
+                self.counters["rate_limited"] += 1
+                now = time.monotonic()
+                # Calls in flight together get rejected together: one decrease per burst of 429s
+                if now - self._last_decrease > self.base_delay:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+                    print(f"DEBUG: {self.name} rate limited, concurrency limit now {self.limit:.1f}")
+            self._schedule()
+
+    @staticmethod
+    def _outcome(exc: BaseException) -> str:
+        return "rate_limited" if is_rate_limit(exc) else "error"
+
+    # Async callers (LLM)
+    @asynccontextmanager
+    async def slot(self, tokens: int = 1, session_id: Optional[str] = None):
+        """Hold one call slot for the duration of the block. No retries (used for streaming)."""
+        session_id = session_id or current_session.get()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = self._enqueue(session_id, tokens, lambda: loop.call_soon_threadsafe(_resolve, future))
+        try:
+            await future
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        outcome = "cancelled"
+        try:
+            yield
+            outcome = "ok"
+        except Exception as e:
+            outcome = self._outcome(e)
+            raise
+        finally:
+            self._release(session_id, outcome)
+
+    async def run(self, fn: Callable[[], Awaitable[T]], tokens: int = 1, session_id: Optional[str] = None) -> T:
+        """Await `fn()` in a slot, retrying rate limits and transient errors with backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.slot(tokens, session_id):
+                    return await fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    with self._lock:
+                        self.counters["failed"] += 1
+                    raise
+                delay = backoff_delay(attempt, self.base_delay)
+                with self._lock:
+                    self.counters["retries"] += 1
+                print(f"DEBUG: {self.name} call failed ({e}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    # Blocking callers (embeddings, which run on worker threads)
+    @contextmanager
+    def sync_slot(self, tokens: int = 1, session_id: Optional[str] = None):
+        session_id = session_id or current_session.get()
+        event = threading.Event()
+        self._enqueue(session_id, tokens, event.set)
+        event.wait()
+        outcome = "cancelled"
+        try:
+            yield
+            outcome = "ok"
+        except Exception as e:
+            outcome = self._outcome(e)
+            raise
+        finally:
+            self._release(session_id, outcome)
+
+    def call(self, fn: Callable[[], T], tokens: int = 1, session_id: Optional[str] = None) -> T:
+        """Blocking counterpart of run()."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.sync_slot(tokens, session_id):
+                    return fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    with self._lock:
+                        self.counters["failed"] += 1
+                    raise
+                delay = backoff_delay(attempt, self.base_delay)
+                with self._lock:
+                    self.counters["retries"] += 1
+                print(f"DEBUG: {self.name} call failed ({e}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._refill()
+            return {
+                "limit": round(self.limit, 2),
+                "max_concurrency": self.max_concurrency,
+                "session_concurrency": self.session_concurrency,
+                "in_flight": self._in_flight,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "queued_sessions": len(self._queues),
+                "tokens_available": round(self._tokens) if self.tokens_per_minute else None,
+                **self.counters
+            }
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeddings wrapper that makes every provider call wait for a scheduler slot."""
+
+    def __init__(self, underlying: Embeddings, scheduler: ProviderScheduler):
+        self.underlying = underlying
+        self.scheduler = scheduler
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.scheduler.call(lambda: self.underlying.embed_documents(texts), tokens=estimate_tokens(*texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.scheduler.call(lambda: self.underlying.embed_query(text), tokens=estimate_tokens(text))
+
+
+llm_scheduler = ProviderScheduler("llm", LLM_MAX_CONCURRENCY, LLM_SESSION_CONCURRENCY, LLM_TOKENS_PER_MINUTE)
+embedding_scheduler = ProviderScheduler("embeddings", EMBED_MAX_CONCURRENCY, EMBED_SESSION_CONCURRENCY,
+                                        EMBED_TOKENS_PER_MINUTE)
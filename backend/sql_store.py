@@ -0,0 +1,443 @@
+"""
+SQLite-backed store implementing the InMemoryStore interface, so sessions, documents,
+clauses (with their ingest-time vectors), assessments and results survive restarts.
+Selected with STORE_BACKEND=sqlite; the database lives at STORE_DB_PATH.
+"""
+import os
+import threading
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, Index, Integer, LargeBinary, MetaData, String, Table, Text,
+    create_engine, delete, event, func, insert, inspect, or_, select, update, bindparam
+)
+from sqlalchemy.schema import CreateColumn
+
+from .models import Document, Clause, Assessment, AssessmentResult
+
+# Only write last_activity when it is older than this, so reads don't turn into writes
+ACTIVITY_WRITE_INTERVAL = timedelta(seconds=30)
+
+metadata = MetaData()
+
+# Every table is keyed by (session_id, id); ids are per-session counters, as in InMemoryStore
+sessions_table = Table(
+    "store_sessions", metadata,
+    Column("session_id", String, primary_key=True),
+    Column("doc_counter", Integer, nullable=False, default=0),
+    Column("clause_counter", Integer, nullable=False, default=0),
+    Column("assessment_counter", Integer, nullable=False, default=0),
+    Column("result_counter", Integer, nullable=False, default=0),
+    Column("last_activity", DateTime, nullable=False),
+    Index("ix_store_sessions_activity", "last_activity"),
+)
+
+documents_table = Table(
+    "store_documents", metadata,
+    Column("session_id", String, primary_key=True),
+    Column("id", Integer, primary_key=True),
+    Column("filename", String, nullable=False),
+    Column("file_type", String, nullable=False),
+    Column("version", String, nullable=False),
+    Column("uploaded_at", DateTime, nullable=False),
+    Column("namespace", String, nullable=True),
+)
+
+clauses_table = Table(
+    "store_clauses", metadata,
+    Column("session_id", String, primary_key=True),
+    Column("id", Integer, primary_key=True),
+    Column("document_id", Integer, nullable=False),
+    Column("clause_id", String, nullable=False),
+    Column("text", Text, nullable=False),
+    Column("page_number", Integer, nullable=False),
+    Column("severity", String, nullable=False),
+    # float32 bytes of the ingest-time embedding
+    Column("vector", LargeBinary),
+    Index("ix_store_clauses_doc", "session_id", "document_id", "id"),
+    # Includes id so "first clause with this label" is answered from the index alone
+    Index("ix_store_clauses_doc_label", "session_id", "document_id", "clause_id", "id"),
+)
+
+assessments_table = Table(
+    "store_assessments", metadata,
+    Column("session_id", String, primary_key=True),
+    Column("id", Integer, primary_key=True),
+    Column("customer_doc_id", Integer, nullable=False),
+    Column("regulation_doc_id", Integer, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("status", String, nullable=False, server_default="complete"),
+    Column("total_clauses", Integer, nullable=False, server_default="0"),
+    Column("threshold", Float, nullable=True),
+    Column("context_k", Integer, nullable=True),
+    Column("use_kb", Boolean, nullable=True),
+    Index("ix_store_assessments_customer", "session_id", "customer_doc_id"),
+    Index("ix_store_assessments_regulation", "session_id", "regulation_doc_id"),
+)
+
+results_table = Table(
+    "store_assessment_results", metadata,
+    Column("session_id", String, primary_key=True),
+    Column("id", Integer, primary_key=True),
+    Column("assessment_id", Integer, nullable=False),
+    Column("customer_clause_id", Integer, nullable=False),
+    Column("regulation_clause_id", Integer, nullable=False),
+    Column("status", String, nullable=False),
+    Column("risk", String, nullable=False),
+    Column("reasoning", Text, nullable=False),
+    Column("evidence_text", Text, nullable=False),
+    Column("confidence", Float, nullable=False),
+    Index("ix_store_results_assessment", "session_id", "assessment_id", "id"),
+)
+
+_CLAUSE_COLUMNS = [clauses_table.c[name] for name in Clause.__slots__]
+_RESULT_COLUMNS = [results_table.c[name] for name in AssessmentResult.__slots__]
+
+
+class SQLStore:
+    """Durable store with the same methods as InMemoryStore, backed by SQLite in WAL mode."""
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+        event.listen(self.engine, "connect", _configure_connection)
+        metadata.create_all(self.engine)
+        self._add_missing_columns()
+        # Serialises id allocation; SQLite allows a single writer anyway
+        self._lock = threading.RLock()
+        self._activity_written: Dict[str, datetime] = {}
+        print(f"DEBUG: Using SQLite store at {db_path}")
+
+    def _add_missing_columns(self):
+        """Databases created before a column was added get it in place; new columns always have a default."""
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for table in metadata.sorted_tables:
+                existing = {c["name"] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        print(f"DEBUG: Adding column {table.name}.{column.name}")
+                        conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(self.engine)}")
+
+    # Session bookkeeping
+    def _touch(self, conn, session_id: str):
+        now = datetime.utcnow()
+        last = self._activity_written.get(session_id)
+        if last and now - last < ACTIVITY_WRITE_INTERVAL:
+            return
+        updated = conn.execute(
+            update(sessions_table).where(sessions_table.c.session_id == session_id).values(last_activity=now)
+        ).rowcount
+        if not updated:
+            print(f"DEBUG: Initializing new session: {session_id}")
+            conn.execute(insert(sessions_table).values(
+                session_id=session_id, doc_counter=0, clause_counter=0,
+                assessment_counter=0, result_counter=0, last_activity=now
+            ))
+        self._activity_written[session_id] = now
+
+    def _read(self, session_id: str, stmt):
+        with self.engine.begin() as conn:
+            self._touch(conn, session_id)
+            return conn.execute(stmt).all()
+
+    def _next_ids(self, conn, session_id: str, counter: str, count: int = 1) -> int:
+        """Reserve `count` consecutive ids; returns the first."""
+        self._touch(conn, session_id)
+        column = sessions_table.c[counter]
+        where = sessions_table.c.session_id == session_id
+        conn.execute(update(sessions_table).where(where).values({column: column + count}))
+        return conn.execute(select(column).where(where)).scalar_one() - count + 1
+
+    def reset(self, session_id: str = None):
+        """Clear data for a specific session or all sessions."""
+        with self._lock, self.engine.begin() as conn:
+            for table in (results_table, assessments_table, clauses_table, documents_table, sessions_table):
+                stmt = delete(table)
+                if session_id:
+                    stmt = stmt.where(table.c.session_id == session_id)
+                conn.execute(stmt)
+            if session_id:
+                print(f"DEBUG: Resetting session {session_id}")
+                self._activity_written.pop(session_id, None)
+            else:
+                print("DEBUG: Resetting all sessions")
+                self._activity_written = {}
+
+    def update_activity(self, session_id: str):
+        """Refresh last activity timestamp for a session."""
+        self._activity_written.pop(session_id, None)
+        with self.engine.begin() as conn:
+            self._touch(conn, session_id)
+
+    def session_ids(self) -> List[str]:
+        with self.engine.connect() as conn:
+            return list(conn.execute(select(sessions_table.c.session_id)).scalars())
+
+    def inactive_sessions(self, idle: timedelta) -> List[str]:
+        """Ids of sessions with no activity for longer than `idle`."""
+        cutoff = datetime.utcnow() - idle
+        with self.engine.connect() as conn:
+            return list(conn.execute(
+                select(sessions_table.c.session_id).where(sessions_table.c.last_activity < cutoff)
+            ).scalars())
+
+    def reset_idle_timers(self):
+        """Mark every persisted session as active now."""
+        self._activity_written.clear()
+        with self.engine.begin() as conn:
+            conn.execute(update(sessions_table).values(last_activity=datetime.utcnow()))
+
+    def session_counts(self, session_id: str) -> Dict[str, int]:
+        with self.engine.begin() as conn:
+            self._touch(conn, session_id)
+            documents = conn.execute(
+                select(func.count()).select_from(documents_table).where(documents_table.c.session_id == session_id)
+            ).scalar_one()
+            clauses = conn.execute(
+                select(func.count()).select_from(clauses_table).where(clauses_table.c.session_id == session_id)
+            ).scalar_one()
+        return {"documents": documents, "clauses": clauses}
+
+    # Document operations
+    def add_document(self, session_id: str, filename: str, file_type: str, version: str = "1.0",
+                     namespace: Optional[str] = None) -> Document:
+        with self._lock, self.engine.begin() as conn:
+            doc = Document(
+                id=self._next_ids(conn, session_id, "doc_counter"),
+                filename=filename,
+                file_type=file_type,
+                version=version,
+                namespace=namespace
+            )
+            conn.execute(insert(documents_table).values(session_id=session_id, **doc.__dict__))
+            return doc
+
+    def get_document(self, session_id: str, doc_id: int) -> Optional[Document]:
+        rows = self._read(session_id, select(
+            documents_table.c.id, documents_table.c.filename, documents_table.c.file_type,
+            documents_table.c.version, documents_table.c.uploaded_at, documents_table.c.namespace
+        ).where(documents_table.c.session_id == session_id, documents_table.c.id == doc_id))
+        return Document(*rows[0]) if rows else None
+
+    def get_all_documents(self, session_id: str) -> List[Document]:
+        rows = self._read(session_id, select(
+            documents_table.c.id, documents_table.c.filename, documents_table.c.file_type,
+            documents_table.c.version, documents_table.c.uploaded_at, documents_table.c.namespace
+        ).where(documents_table.c.session_id == session_id).order_by(documents_table.c.id))
+        return [Document(*row) for row in rows]
+
+    def update_document_type(self, session_id: str, doc_id: int, file_type: str) -> bool:
+        with self.engine.begin() as conn:
+            self._touch(conn, session_id)
+            return conn.execute(
+                update(documents_table)
+                .where(documents_table.c.session_id == session_id, documents_table.c.id == doc_id)
+                .values(file_type=file_type)
+            ).rowcount > 0
+
+    def delete_document(self, session_id: str, doc_id: int) -> bool:
+        with self._lock, self.engine.begin() as conn:
+            self._touch(conn, session_id)
+            deleted = conn.execute(delete(documents_table).where(
+                documents_table.c.session_id == session_id, documents_table.c.id == doc_id
+            )).rowcount
+            if not deleted:
+                return False
+            # Delete related clauses
+            conn.execute(delete(clauses_table).where(
+                clauses_table.c.session_id == session_id, clauses_table.c.document_id == doc_id
+            ))
+            return True
+
+    # Clause operations
+    def add_clause(self, session_id: str, document_id: int, clause_id: str, text: str,
+                   page_number: int, severity: str) -> Clause:
+        return self.add_clauses(session_id, document_id, [{
+            "clause_id": clause_id, "text": text, "page_number": page_number, "severity": severity
+        }])[0]
+
+    def add_clauses(self, session_id: str, document_id: int, clauses: List[Dict]) -> List[Clause]:
+        """Add a batch of parsed clauses in a single transaction (one executemany)."""
+        if not clauses:
+            return []
+        with self._lock, self.engine.begin() as conn:
+            first_id = self._next_ids(conn, session_id, "clause_counter", len(clauses))
+            stored = [
+                Clause(
+                    id=first_id + i,
+                    document_id=document_id,
+                    clause_id=c['clause_id'],
+                    text=c['text'],
+                    page_number=c['page_number'],
+                    severity=c['severity']
+                )
+                for i, c in enumerate(clauses)
+            ]
+            conn.execute(insert(clauses_table), [
+                {"session_id": session_id, **{name: getattr(c, name) for name in Clause.__slots__}}
+                for c in stored
+            ])
+            return stored
+
+    def set_clause_vector(self, session_id: str, clause_id: int, vector: List[float]):
+        self.set_clause_vectors(session_id, {clause_id: vector})
+
+    def set_clause_vectors(self, session_id: str, vectors: Dict[int, List[float]]):
+        if not vectors:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(clauses_table)
+                .where(clauses_table.c.session_id == bindparam("sid"), clauses_table.c.id == bindparam("cid"))
+                .values(vector=bindparam("vec")),
+                [
+                    {"sid": session_id, "cid": cid, "vec": array("f", vector).tobytes()}
+                    for cid, vector in vectors.items()
+                ]
+            )
+
+    def get_clause_vector(self, session_id: str, clause_id: int) -> Optional[List[float]]:
+        rows = self._read(session_id, select(clauses_table.c.vector).where(
+            clauses_table.c.session_id == session_id, clauses_table.c.id == clause_id
+        ))
+        if not rows or rows[0][0] is None:
+            return None
+        vector = array("f")
+        vector.frombytes(rows[0][0])
+        return vector.tolist()
+
+    def get_clause(self, session_id: str, clause_id: int) -> Optional[Clause]:
+        rows = self._read(session_id, select(*_CLAUSE_COLUMNS).where(
+            clauses_table.c.session_id == session_id, clauses_table.c.id == clause_id
+        ))
+        return Clause(*rows[0]) if rows else None
+
+    def get_clauses_by_document(self, session_id: str, doc_id: int) -> List[Clause]:
+        rows = self._read(session_id, select(*_CLAUSE_COLUMNS).where(
+            clauses_table.c.session_id == session_id, clauses_table.c.document_id == doc_id
+        ).order_by(clauses_table.c.id))
+        return [Clause(*row) for row in rows]
+
+    def get_clause_by_doc_and_clause_id(self, session_id: str, doc_id: int, clause_id_str: str) -> Optional[Clause]:
+        # First clause with a given label wins, as in InMemoryStore
+        rows = self._read(session_id, select(*_CLAUSE_COLUMNS).where(
+            clauses_table.c.session_id == session_id,
+            clauses_table.c.document_id == doc_id,
+            clauses_table.c.clause_id == clause_id_str
+        ).order_by(clauses_table.c.id).limit(1))
+        return Clause(*rows[0]) if rows else None
+
+    # Assessment operations
+    def add_assessment(self, session_id: str, customer_doc_id: int, regulation_doc_id: int,
+                       status: str = "complete", total_clauses: int = 0, threshold: Optional[float] = None,
+                       context_k: Optional[int] = None, use_kb: Optional[bool] = None) -> Assessment:
+        with self._lock, self.engine.begin() as conn:
+            assessment = Assessment(
+                id=self._next_ids(conn, session_id, "assessment_counter"),
+                customer_doc_id=customer_doc_id,
+                regulation_doc_id=regulation_doc_id,
+                status=status,
+                total_clauses=total_clauses,
+                threshold=threshold,
+                context_k=context_k,
+                use_kb=use_kb
+            )
+            conn.execute(insert(assessments_table).values(session_id=session_id, **assessment.__dict__))
+            return assessment
+
+    def _assessment_query(self, session_id: str):
+        return select(
+            assessments_table.c.id, assessments_table.c.customer_doc_id,
+            assessments_table.c.regulation_doc_id, assessments_table.c.created_at,
+            assessments_table.c.status, assessments_table.c.total_clauses, assessments_table.c.threshold,
+            assessments_table.c.context_k, assessments_table.c.use_kb
+        ).where(assessments_table.c.session_id == session_id)
+
+    def get_assessment(self, session_id: str, assessment_id: int) -> Optional[Assessment]:
+        rows = self._read(session_id, self._assessment_query(session_id).where(assessments_table.c.id == assessment_id))
+        return Assessment(*rows[0]) if rows else None
+
+    def get_assessments_by_doc(self, session_id: str, doc_id: int) -> List[Assessment]:
+        rows = self._read(session_id, self._assessment_query(session_id).where(or_(
+            assessments_table.c.customer_doc_id == doc_id, assessments_table.c.regulation_doc_id == doc_id
+        )).order_by(assessments_table.c.id))
+        return [Assessment(*row) for row in rows]
+
+    def set_assessment_status(self, session_id: str, assessment_id: int, status: str):
+        with self.engine.begin() as conn:
+            conn.execute(update(assessments_table).where(
+                assessments_table.c.session_id == session_id, assessments_table.c.id == assessment_id
+            ).values(status=status))
+
+    # Assessment result operations
+    def add_result(self, session_id: str, assessment_id: int, customer_clause_id: int,
+                   regulation_clause_id: int, status: str, risk: str,
+                   reasoning: str, evidence_text: str, confidence: float) -> AssessmentResult:
+        with self._lock, self.engine.begin() as conn:
+            result = AssessmentResult(
+                id=self._next_ids(conn, session_id, "result_counter"),
+                assessment_id=assessment_id,
+                customer_clause_id=customer_clause_id,
+                regulation_clause_id=regulation_clause_id,
+                status=status,
+                risk=risk,
+                reasoning=reasoning,
+                evidence_text=evidence_text,
+                confidence=confidence
+            )
+            conn.execute(insert(results_table).values(
+                session_id=session_id, **{name: getattr(result, name) for name in AssessmentResult.__slots__}
+            ))
+            return result
+
+    def get_results_by_assessment(self, session_id: str, assessment_id: int) -> List[AssessmentResult]:
+        rows = self._read(session_id, select(*_RESULT_COLUMNS).where(
+            results_table.c.session_id == session_id, results_table.c.assessment_id == assessment_id
+        ).order_by(results_table.c.id))
+        return [AssessmentResult(*row) for row in rows]
+
+    def delete_results_by_assessment(self, session_id: str, assessment_id: int):
+        with self.engine.begin() as conn:
+            conn.execute(delete(results_table).where(
+                results_table.c.session_id == session_id, results_table.c.assessment_id == assessment_id
+            ))
+
+    def delete_assessment(self, session_id: str, assessment_id: int):
+        with self._lock, self.engine.begin() as conn:
+            self._touch(conn, session_id)
+            conn.execute(delete(results_table).where(
+                results_table.c.session_id == session_id, results_table.c.assessment_id == assessment_id
+            ))
+            conn.execute(delete(assessments_table).where(
+                assessments_table.c.session_id == session_id, assessments_table.c.id == assessment_id
+            ))
+
+    def memory_report(self, session_id: str) -> Dict:
+        """Row counts for the session; data lives on disk, so only the file size is reported."""
+        with self.engine.connect() as conn:
+            counts = {
+                name: conn.execute(
+                    select(func.count()).select_from(table).where(table.c.session_id == session_id)
+                ).scalar_one()
+                for name, table in (
+                    ("documents", documents_table), ("clauses", clauses_table), ("results", results_table)
+                )
+            }
+            counts["vectors"] = conn.execute(
+                select(func.count()).select_from(clauses_table)
+                .where(clauses_table.c.session_id == session_id, clauses_table.c.vector.is_not(None))
+            ).scalar_one()
+        counts["database_bytes"] = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        return counts
+
+
+def _configure_connection(dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    # WAL: readers don't block the writer; NORMAL sync is durable across app crashes
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
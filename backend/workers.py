@@ -0,0 +1,43 @@
+"""
+Bounded thread pools for blocking work (parsing, embedding, vector search, report rendering)
+so that none of it runs on the event loop. Pool sizes are configurable via env vars.
+"""
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "8"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+NAMESPACE_SEARCH_WORKERS = int(os.getenv("NAMESPACE_SEARCH_WORKERS", "16"))
+FILE_IO_WORKERS = int(os.getenv("FILE_IO_WORKERS", "4"))
+
+# Upload parsing + embedding: few workers, each job is large
+ingest_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+# Vector search (and the occasional query embedding): many short jobs
+retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+# PDF report generation
+render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+# Per-namespace vector queries fanned out from a single retrieval. Separate from retrieval_pool,
+# whose threads block on these futures and would deadlock a shared, saturated pool
+namespace_search_pool = ThreadPoolExecutor(max_workers=NAMESPACE_SEARCH_WORKERS, thread_name_prefix="ns-search")
+# Spooling upload bytes to and from disk. Kept off ingest_pool, whose threads are busy
+# parsing for as long as a document takes, so /upload never waits behind them
+file_io_pool = ThreadPoolExecutor(max_workers=FILE_IO_WORKERS, thread_name_prefix="file-io")
+
+
+async def run_blocking(pool: ThreadPoolExecutor, fn, *args, **kwargs):
+    """Run a blocking callable on the given pool and await its result.
+
+    The callable sees the caller's context variables (e.g. the session its provider calls are queued under).
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(pool, functools.partial(context.run, fn, *args, **kwargs))
+
+
+def shutdown_pools():
+    for pool in (ingest_pool, retrieval_pool, render_pool, namespace_search_pool, file_io_pool):
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -55,6 +55,18 @@ function App() {
     }
   };
 
+  // Partial graph of a running assessment; the final refresh goes through handleAssessmentComplete
+  const handleAssessmentProgress = async (assessmentId) => {
+    setAssessmentId(assessmentId);
+    try {
+      const res = await axios.get(`${API_BASE}/graph/${assessmentId}`);
+      setGraphData(res.data);
+      setLoading(false);
+    } catch (e) {
+      console.error("Failed to load graph", e);
+    }
+  };
+
   const handleStartAnalysis = () => {
     setLoading(true);
     setGraphData(null);
@@ -70,6 +82,7 @@ function App() {
     <div style={{ display: 'flex', width: '100vw', height: '100vh', overflow: 'hidden', background: '#0c0c0e' }}>
       <Sidebar
         onAssessmentComplete={handleAssessmentComplete}
+        onAssessmentProgress={handleAssessmentProgress}
         onStartAnalysis={handleStartAnalysis}
         selectedNode={selectedNode}
         assessmentId={assessmentId}
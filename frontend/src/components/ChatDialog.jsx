@@ -1,7 +1,6 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { MessageSquare, Send, X, Bot, User, Maximize2, Minimize2 } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
-import axios from 'axios';
 
 const API_BASE = import.meta.env.VITE_API_BASE || 'http://localhost:8000';
 
@@ -30,9 +29,48 @@ const ChatDialog = ({ isFullScreen = false, useKb = false }) => {
             const formData = new FormData();
             formData.append('query', input);
             formData.append('use_kb', useKb);
-            const res = await axios.post(`${API_BASE}/chat`, formData);
+            // Streamed as server-sent events; fetch instead of axios so tokens render as they arrive
+            const res = await fetch(`${API_BASE}/chat/stream`, {
+                method: 'POST',
+                body: formData,
+                headers: { 'X-Session-ID': sessionStorage.getItem('compliance_session_id') || '' }
+            });
+            if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
 
-            setMessages(prev => [...prev, { role: 'bot', content: res.data.answer }]);
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let started = false;
+            const appendToAnswer = (text) => {
+                if (!started) {
+                    // First token: swap the typing indicator for the message being streamed
+                    started = true;
+                    setLoading(false);
+                    setMessages(prev => [...prev, { role: 'bot', content: text }]);
+                    return;
+                }
+                setMessages(prev => {
+                    const last = prev[prev.length - 1];
+                    return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+                });
+            };
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const raw of events) {
+                    const event = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = raw.match(/^data: (.*)$/m)?.[1];
+                    if (!event || !data) continue;
+                    const payload = JSON.parse(data);
+                    if (event === 'token' || event === 'sources') appendToAnswer(payload.text);
+                    if (event === 'error') throw new Error(payload.detail);
+                }
+            }
+            if (!started) throw new Error('Empty response');
         } catch (e) {
             setMessages(prev => [...prev, { role: 'bot', content: "Failed to connect to the AI analyst. Is the backend running?" }]);
         } finally {
@@ -134,6 +172,7 @@ const ChatDialog = ({ isFullScreen = false, useKb = false }) => {
                             color: 'white',
                             fontSize: isFullScreen ? '16px' : '14px',
                             lineHeight: 1.6,
+                            whiteSpace: 'pre-wrap',
                             boxShadow: m.role === 'user' ? '0 4px 12px rgba(99, 102, 241, 0.3)' : 'none'
                         }}
                     >
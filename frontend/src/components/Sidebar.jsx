@@ -5,10 +5,11 @@ import { motion, AnimatePresence } from 'framer-motion';
 
 const API_BASE = import.meta.env.VITE_API_BASE || 'http://localhost:8000';
 
-const Sidebar = ({ onAssessmentComplete, selectedNode, onStartAnalysis, onNodeClick, assessmentId, mode, useKb }) => {
+const Sidebar = ({ onAssessmentComplete, onAssessmentProgress, selectedNode, onStartAnalysis, onNodeClick, assessmentId, mode, useKb }) => {
     const [files, setFiles] = useState([]);
     const [uploading, setUploading] = useState(false);
     const [uploadProgress, setUploadProgress] = useState(0);
+    const [ingestProgress, setIngestProgress] = useState({});
     const [selectedDocs, setSelectedDocs] = useState([]);
 
     // Color palette for file highlighting
@@ -91,6 +92,7 @@ const Sidebar = ({ onAssessmentComplete, selectedNode, onStartAnalysis, onNodeCl
 
         setUploading(true);
         setUploadProgress(0);
+        setIngestProgress({});
 
         try {
             const uploadPromises = selectedFiles.map(async (file, index) => {
@@ -98,22 +100,40 @@ const Sidebar = ({ onAssessmentComplete, selectedNode, onStartAnalysis, onNodeCl
                 formData.append('file', file);
                 formData.append('file_type', 'customer');
 
-                return await axios.post(`${API_BASE}/upload`, formData, {
+                const res = await axios.post(`${API_BASE}/upload`, formData, {
                     onUploadProgress: (progressEvent) => {
                         const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
                         const totalProgress = ((index + (percentCompleted / 100)) / selectedFiles.length) * 100;
                         setUploadProgress(Math.round(totalProgress));
                     }
                 });
+                return await waitForJob(res.data.job_id);
             });
 
-            await Promise.all(uploadPromises);
+            const jobs = await Promise.all(uploadPromises);
+            if (jobs.some(job => job.status === 'failed')) {
+                alert("Some files failed to ingest.");
+            }
             fetchDocs();
         } catch (e) {
             alert("Upload failed.");
         } finally {
             setUploading(false);
             setUploadProgress(0);
+            setIngestProgress({});
+        }
+    };
+
+    // Uploads are processed by a background job; poll its status until it settles
+    const waitForJob = async (jobId) => {
+        while (true) {
+            const res = await axios.get(`${API_BASE}/jobs/${jobId}`);
+            setIngestProgress(prev => ({ ...prev, [jobId]: res.data }));
+            if (res.data.status === 'done' || res.data.status === 'failed') {
+                fetchDocs();
+                return res.data;
+            }
+            await new Promise(resolve => setTimeout(resolve, 750));
         }
     };
 
@@ -157,8 +177,47 @@ const Sidebar = ({ onAssessmentComplete, selectedNode, onStartAnalysis, onNodeCl
             formData.append('regulation_doc_id', firstDoc.id);
             formData.append('use_kb', useKb);
 
-            const res = await axios.post(`${API_BASE}/assess`, formData);
-            onAssessmentComplete(res.data.assessment_id);
+            // Verdicts stream in as server-sent events; the graph is refreshed at most once a second meanwhile
+            const res = await fetch(`${API_BASE}/assess/stream`, {
+                method: 'POST',
+                body: formData,
+                headers: { 'X-Session-ID': sessionStorage.getItem('compliance_session_id') || '' }
+            });
+            if (!res.ok || !res.body) {
+                const body = await res.json().catch(() => ({}));
+                throw new Error(body.detail || `HTTP ${res.status}`);
+            }
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let assessment = null;
+            let lastRefresh = 0;
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const raw of events) {
+                    const event = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = raw.match(/^data: (.*)$/m)?.[1];
+                    if (!event || !data) continue;
+                    const payload = JSON.parse(data);
+                    if (event === 'started') {
+                        assessment = payload.assessment_id;
+                    } else if (event === 'result' && Date.now() - lastRefresh > 1000) {
+                        lastRefresh = Date.now();
+                        onAssessmentProgress(assessment);
+                    } else if (event === 'done') {
+                        onAssessmentComplete(assessment);
+                        return;
+                    } else if (event === 'error') {
+                        throw new Error(payload.detail);
+                    }
+                }
+            }
+            throw new Error('Assessment stream ended unexpectedly');
         } catch (e) {
             console.error("Assessment Error:", e);
             const detail = e.response?.data?.detail || e.message;
@@ -252,6 +311,11 @@ const Sidebar = ({ onAssessmentComplete, selectedNode, onStartAnalysis, onNodeCl
                                 <div style={{ flex: 1 }}>
                                     <div style={{ fontSize: '14px', fontWeight: 500 }}>Ingesting...</div>
                                     <div style={{ fontSize: '11px', opacity: 0.5 }}>{uploadProgress}% completed</div>
+                                    {Object.values(ingestProgress).map(p => (
+                                        <div key={p.job_id} style={{ fontSize: '10px', opacity: 0.5 }}>
+                                            {p.filename}: {p.status} · page {p.pages_parsed}/{p.total_pages || '?'} · {p.clauses_embedded} clauses embedded
+                                        </div>
+                                    ))}
                                 </div>
                             </div>
                             <div style={{
@@ -461,7 +525,7 @@ const Sidebar = ({ onAssessmentComplete, selectedNode, onStartAnalysis, onNodeCl
                                 </div>
                                 <div>
                                     <span style={{ fontSize: '11px', opacity: 0.5, textTransform: 'uppercase' }}>Status</span>
-                                    <div style={{ color: selectedNode.status === 'COMPLIANT' ? '#10b981' : selectedNode.status === 'PARTIAL' ? '#f59e0b' : '#ef4444', fontWeight: 'bold' }}>{selectedNode.status}</div>
+                                    <div style={{ color: selectedNode.status === 'COMPLIANT' ? '#10b981' : selectedNode.status === 'PARTIAL' ? '#f59e0b' : selectedNode.status === 'NO_MATCH' ? '#94a3b8' : '#ef4444', fontWeight: 'bold' }}>{selectedNode.status}</div>
                                 </div>
                             </div>
                         )}
@@ -143,6 +143,7 @@ const NeuronNode = ({ id, position: initialPosition, label, type, data, isSelect
         if (type === 'regulation') return '#00d4ff'; // Cyan for standards
         if (data?.status === 'COMPLIANT') return '#00ff9d'; // Electric green
         if (data?.status === 'PARTIAL') return '#ffaa00'; // Amber
+        if (data?.status === 'NO_MATCH') return '#8892b0'; // Slate: no counterpart in the regulation
         return '#ff3366'; // Hot pink for non-compliant
     }, [type, data]);
 
@@ -305,7 +306,7 @@ const Synapse = ({ start, end, status }) => {
     const lineRef = useRef();
     const flowRef = useRef();
 
-    const color = status === 'COMPLIANT' ? '#00ff9d' : status === 'PARTIAL' ? '#ffaa00' : '#ff3366';
+    const color = status === 'COMPLIANT' ? '#00ff9d' : status === 'PARTIAL' ? '#ffaa00' : status === 'NO_MATCH' ? '#8892b0' : '#ff3366';
 
     const points = useMemo(() => [
         new THREE.Vector3(...start),
@@ -348,7 +349,10 @@ const ThreeScene = ({ graphData: data, onNodeClick, selectedNode, loading }) =>
         if (!data) return;
         const initialPositions = {};
         data.nodes.forEach((node, idx) => {
-            if (node.type === 'regulation') {
+            // Keep nodes already placed (and possibly dragged) when a running assessment adds verdicts
+            if (nodePositions[node.id]) {
+                initialPositions[node.id] = nodePositions[node.id];
+            } else if (node.type === 'regulation') {
                 const angle = (idx / data.nodes.filter(n => n.type === 'regulation').length) * Math.PI * 2;
                 initialPositions[node.id] = [Math.cos(angle) * 2.5, Math.sin(angle) * 2.5, 0];
             } else {